@@ -1,39 +1,57 @@
-from cProfile import label
+import argparse
+import json
 import math
+import os
 import random
-import matplotlib.pyplot as plt
+import time
+import numpy as np
 
 # Model constants
 rating_change_default = 25
 
+# At maximum you can improve your skill by learning_maximum points per game. Change this value to whatever you want
+learning_maximum_default = 2
+
+# At minimum you can improve your skill by learning_minimum points per game. Change this value to whatever you want
+learning_minimum_default = 0
+
 # Simulation props
 rating_formal_initial = 6000
 rating_actual_initial = 2000
 games_played_total = 1000
 
+# Population simulation props
+players_total = 100000
+percentiles_default = (5, 25, 50, 75, 95)
+
+# Distribution solver props
+actual_bin_width = 1.0
+probability_tolerance = 1e-12
+
+# Ladder simulation props
+rating_actual_spread = 1000
+queue_ratio_default = 0.5
+
 # Analysis prefs
 winrate_interval_param = 50
+plot_points_maximum = 4000
 
 
-def learning_curve(rating_actual, rating_formal, game_result):
+def learning_curve(rating_actual, rating_formal, game_result, tanh=math.tanh,
+                   learning_maximum=learning_maximum_default, learning_minimum=learning_minimum_default):
     # In general, you don't learn much when you play with weak players
     # But you learn quickly if you play with strong opponents
-
-    # At maximum you can improve your skill by learning_maximum points. Change this value to whatever you want
-    learning_maximum = 2
-
-    # At minimum you can improve your skill by learning_minimum points. Change this value to whatever you want
-    learning_minimum = 0
+    # Pass np.tanh to update whole arrays of players at once
 
     rating_diff = rating_actual - rating_formal
     factored = -rating_diff * 0.001
-    lerp_alpha = (1 + math.tanh(factored)) * 0.5
+    lerp_alpha = (1 + tanh(factored)) * 0.5
     lerp = (learning_maximum - learning_minimum) * lerp_alpha + learning_minimum
     return lerp
 
-def victory_chance(rating_diff):
+def victory_chance(rating_diff, tanh=math.tanh):
     factored = rating_diff * 0.0005
-    return (1 + math.tanh(factored)) * 0.5
+    return (1 + tanh(factored)) * 0.5
 
 def generate_game_result(chance_to_win):
     # Simple probabilistic generator
@@ -45,105 +63,632 @@ def generate_game_result(chance_to_win):
     else:
         return -1
 
-def calculate_winrate(history, from_index, to_index):
-    wins = 0
-    defeats = 0
+def generate_game_results(chances_to_win, rng):
+    # Vectorized generate_game_result, one game per element of chances_to_win
+    return np.where(rng.random(chances_to_win.shape) < chances_to_win, 1, -1)
 
-    if to_index > from_index:
-        step = 1
-    else:
-        step = -1
+class RollingWinrate:
+    # Winrate of the last games for several window sizes at once.
+    # A ring buffer keeps the last max(windows) results and every window keeps a running count of wins,
+    # so a game costs O(1) per window however long the windows are
+    def __init__(self, windows):
+        self.windows = tuple(windows)
+        self.results = [0] * max(self.windows)
+        self.wins = [0] * len(self.windows)
+        self.games_played = 0
+
+    def push(self, game_result):
+        won = 1 if game_result > 0 else 0
+        size = len(self.results)
+        for j, window in enumerate(self.windows):
+            # The result that leaves the window is read before the ring slot gets overwritten
+            if self.games_played >= window:
+                self.wins[j] -= self.results[(self.games_played - window) % size]
+            self.wins[j] += won
+        self.results[self.games_played % size] = won
+        self.games_played += 1
+
+    def get_winrate(self, window):
+        games = min(self.games_played, window)
+        if games == 0:
+            return None
+        return self.wins[self.windows.index(window)] / games
+
+    def get_winrates(self):
+        return {window: self.get_winrate(window) for window in self.windows}
+
+def get_rolling_winrate(wins, window):
+    # Batch version of RollingWinrate for whole histories, from a prefix sum along the first axis.
+    # wins holds 1 for a victory and 0 for a defeat, or the share of players that won each game
+    wins = np.asarray(wins, dtype=np.float64)
+    prefix = np.zeros((len(wins) + 1,) + wins.shape[1:])
+    np.cumsum(wins, axis=0, out=prefix[1:])
+    end = np.arange(1, len(wins) + 1)
+    start = np.maximum(end - window, 0)
+    games = (end - start).reshape((-1,) + (1,) * (wins.ndim - 1))
+    return (prefix[end] - prefix[start]) / games
+
+class HistoryStore:
+    # Struct-of-arrays history of one player: a preallocated NumPy column per field instead of an object per game.
+    # Columns grow by whole chunks, and get_column returns views that share memory with the store.
+    # Winrates that are not known yet are stored as NaN
+    def __init__(self, windows=(winrate_interval_param,), capacity=0, chunk_size=1 << 16):
+        self.windows = tuple(windows)
+        self.chunk_size = chunk_size
+        self.length = 0
+        self.columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in self.get_dtypes()}
+
+    def get_dtypes(self):
+        dtypes = [
+            ("game_number", np.int64),
+            ("rating_change", np.float32),
+            ("rating_actual", np.float64),
+            ("rating_formal", np.float64),
+            ("winrate_total", np.float32),
+        ]
+        for window in self.windows:
+            dtypes.append((f"winrate_interval_{window}", np.float32))
+        return dtypes
+
+    def __len__(self):
+        return self.length
+
+    def reserve(self, capacity):
+        current = len(self.columns["game_number"])
+        if capacity <= current:
+            return
+
+        # Doubling keeps appends amortized O(1), rounding to chunks keeps small histories small
+        capacity = max(capacity, current * 2)
+        capacity = (capacity + self.chunk_size - 1) // self.chunk_size * self.chunk_size
+        for name, column in self.columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self.length] = column[:self.length]
+            self.columns[name] = grown
+
+    def append(self, game_number, rating_change, rating_actual, rating_formal, winrate_intervals, winrate_total):
+        if self.length == len(self.columns["game_number"]):
+            self.reserve(self.length + 1)
+
+        i = self.length
+        columns = self.columns
+        columns["game_number"][i] = game_number
+        columns["rating_change"][i] = rating_change
+        columns["rating_actual"][i] = rating_actual
+        columns["rating_formal"][i] = rating_formal
+        columns["winrate_total"][i] = np.nan if winrate_total is None else winrate_total
+        for window in self.windows:
+            winrate = winrate_intervals[window]
+            columns[f"winrate_interval_{window}"][i] = np.nan if winrate is None else winrate
+        self.length += 1
+
+    def get_column(self, name):
+        return self.columns[name][:self.length]
+
+    def get_winrate_interval(self, window):
+        return self.get_column(f"winrate_interval_{window}")
+
+    def save(self, directory):
+        # One .npy file per column, so a later load can memory-map only the columns it reads
+        os.makedirs(directory, exist_ok=True)
+        for name in self.columns:
+            np.save(os.path.join(directory, f"{name}.npy"), self.get_column(name))
+        with open(os.path.join(directory, "history.json"), "w") as f:
+            json.dump({"length": self.length, "windows": list(self.windows)}, f)
 
-    for i in range(from_index, to_index, step):
-        if i < 0 or i >= len(history):
-            break
+    @staticmethod
+    def load(directory, mmap=True):
+        # Memory-mapped columns are read-only and paged in on demand.
+        # Appending to a loaded store copies the columns into memory first
+        with open(os.path.join(directory, "history.json")) as f:
+            info = json.load(f)
 
-        record = history[i]
-        if record.rating_change < 0:
-            defeats += 1
+        store = HistoryStore(info["windows"])
+        for name in store.columns:
+            store.columns[name] = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None)
+        store.length = info["length"]
+        return store
+
+def get_percentile_ranks(count, percentiles):
+    # Neighbouring ranks and interpolation weights of the default np.percentile method
+    position = np.asarray(percentiles) / 100 * (count - 1)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, count - 1)
+    return lower, upper, position - lower
+
+def get_sorted_percentiles(sorted_values, percentiles):
+    lower, upper, fraction = get_percentile_ranks(len(sorted_values), percentiles)
+    return sorted_values[lower] * (1 - fraction) + sorted_values[upper] * fraction
+
+def get_count_percentiles(counts, percentiles):
+    # Percentiles of small non-negative integers read from a histogram instead of a sort
+    cumulative = np.cumsum(np.bincount(counts))
+    lower, upper, fraction = get_percentile_ranks(len(counts), percentiles)
+    lower_values = np.searchsorted(cumulative, lower, side='right')
+    upper_values = np.searchsorted(cumulative, upper, side='right')
+    return lower_values * (1 - fraction) + upper_values * fraction
+
+class PopulationResult:
+    # Distribution of a population of independent players after every game.
+    # Bands hold one row per percentile and one column per game
+    def __init__(self, players, games, percentiles):
+        self.players = players
+        self.percentiles = tuple(percentiles)
+        self.game_number = np.arange(games)
+        self.rating_formal_mean = np.empty(games)
+        self.rating_actual_mean = np.empty(games)
+        self.rating_formal_bands = np.empty((len(self.percentiles), games))
+        self.rating_actual_bands = np.empty((len(self.percentiles), games))
+        self.winrate_total_bands = np.empty((len(self.percentiles), games))
+        # Share of the population that won game i
+        self.winrate_game = np.empty(games)
+
+        # Per player values after the last game
+        self.rating_formal_final = None
+        self.rating_actual_final = None
+        self.wins = None
+
+    def record(self, i, rating_formal, rating_actual, game_result, wins):
+        # Sorting is faster than np.percentile, which partitions once per requested rank
+        self.rating_formal_mean[i] = rating_formal.mean()
+        self.rating_actual_mean[i] = rating_actual.mean()
+        self.winrate_game[i] = np.count_nonzero(game_result > 0) / self.players
+        if not self.percentiles:
+            return
+
+        self.rating_formal_bands[:, i] = get_sorted_percentiles(np.sort(rating_formal), self.percentiles)
+        self.rating_actual_bands[:, i] = get_sorted_percentiles(np.sort(rating_actual), self.percentiles)
+        self.winrate_total_bands[:, i] = get_count_percentiles(wins, self.percentiles) / (i + 1)
+
+    def get_winrate_total(self):
+        # Winrate over all games played so far, averaged over the population
+        return np.cumsum(self.winrate_game) / (self.game_number + 1)
+
+    def get_winrate_interval(self, window):
+        # Winrate of the last window games, averaged over the population
+        return get_rolling_winrate(self.winrate_game, window)
+
+def simulate_player(games=games_played_total, windows=(winrate_interval_param,)):
+    current_formal_rating = rating_formal_initial
+    current_actual_rating = rating_actual_initial
+    history = HistoryStore(windows, games)
+    rolling_winrate = RollingWinrate(windows)
+    total_wins = 0
+    total_defeats = 0
+    for i in range(games):
+        # Difference between player's skill and formal rating
+        # Positive number means player plays better than the game thinks
+        skill_difference = current_actual_rating - current_formal_rating
+
+        # Chance to win depends on skill difference. The more this value differs
+        # from 0, the more chance differs from 0.5
+        # See victory_chance(x) for actual relation
+        chance_to_win = victory_chance(skill_difference)
+        game_result = generate_game_result(chance_to_win)
+        if game_result > 0:
+            total_wins += 1
         else:
-            wins += 1
-
-    if wins + defeats == 0:
-        return None
-
-    rate = wins / (wins + defeats)
-    return rate
-
-class HistoryRecord:
-    def __init__(self, game_number, rating_change, rating_actual, rating_formal, winrate_interval, winrate_total):
-        self.game_number = game_number
-        self.rating_change = rating_change
-        self.rating_actual = rating_actual
-        self.rating_formal = rating_formal
-        self.winrate_interval = winrate_interval
-        self.winrate_total = winrate_total
-
-
-current_formal_rating = rating_formal_initial
-current_actual_rating = rating_actual_initial
-history = []
-total_wins = 0
-total_defeats = 0
-for i in range(games_played_total):
-    # Difference between player's skill and formal rating
-    # Positive number means player plays better than the game thinks
-    skill_difference = current_actual_rating - current_formal_rating 
-
-    # Chance to win depends on skill difference. The more this value differs
-    # from 0, the more chance differs from 0.5
-    # See victory_chance(x) for actual relation
-    chance_to_win = victory_chance(skill_difference)
-    game_result = generate_game_result(chance_to_win)
-    if game_result > 0:
-        total_wins += 1
-    else:
-        total_defeats += 1
+            total_defeats += 1
+
+        rating_change = rating_change_default * game_result
+        current_formal_rating += rating_change
+        current_actual_rating += learning_curve(current_actual_rating, current_formal_rating, game_result)
+        rolling_winrate.push(game_result)
+
+        if i > 1:
+            winrate_intervals = rolling_winrate.get_winrates()
+            winrate_total = total_wins/(total_wins + total_defeats)
+        else:
+            winrate_intervals = dict.fromkeys(rolling_winrate.windows)
+            winrate_total = None
+
+        history.append(i, rating_change, current_actual_rating, current_formal_rating, winrate_intervals, winrate_total)
+
+    return history, total_wins, total_defeats
+
+def simulate_population(players=players_total, games=games_played_total, seed=None, percentiles=percentiles_default,
+                        rating_formal=rating_formal_initial, rating_actual=rating_actual_initial, rating_change=rating_change_default,
+                        learning_maximum=learning_maximum_default, learning_minimum=learning_minimum_default):
+    # Same model as simulate_player for many independent players at once.
+    # Every array holds one value per player, so a game is one vectorized step for the whole population
+    rng = np.random.default_rng(seed)
+    current_formal_rating = np.full(players, rating_formal, dtype=np.float64)
+    current_actual_rating = np.full(players, rating_actual, dtype=np.float64)
+    wins = np.zeros(players, dtype=np.int64)
+    result = PopulationResult(players, games, percentiles)
+
+    for i in range(games):
+        chance_to_win = victory_chance(current_actual_rating - current_formal_rating, np.tanh)
+        game_result = generate_game_results(chance_to_win, rng)
+        wins += game_result > 0
+
+        current_formal_rating += rating_change * game_result
+        current_actual_rating += learning_curve(current_actual_rating, current_formal_rating, game_result, np.tanh,
+                                                learning_maximum, learning_minimum)
+        result.record(i, current_formal_rating, current_actual_rating, game_result, wins)
+
+    result.rating_formal_final = current_formal_rating
+    result.rating_actual_final = current_actual_rating
+    result.wins = wins
+    return result
 
-    rating_change = rating_change_default * game_result
-    current_formal_rating += rating_change
-    current_actual_rating += learning_curve(current_actual_rating, current_formal_rating, game_result)    
+class DistributionResult:
+    # Expected trajectory and percentile bands of one player, read from the probability distribution after every game
+    def __init__(self, games, percentiles):
+        self.percentiles = tuple(percentiles)
+        self.game_number = np.arange(games)
+        self.rating_formal_mean = np.empty(games)
+        self.rating_actual_mean = np.empty(games)
+        self.rating_formal_bands = np.empty((len(self.percentiles), games))
+        self.rating_actual_bands = np.empty((len(self.percentiles), games))
+        # Probability to win game i
+        self.winrate_game = np.empty(games)
+        # Number of (formal rating, actual rating) states with non-negligible probability
+        self.states = np.empty(games, dtype=np.int64)
+        # Probability of the states dropped below the tolerance so far
+        self.lost_probability = np.empty(games)
 
-    if i > 1:
-        winrate_interval = calculate_winrate(history, i - 1, i - winrate_interval_param)
-        winrate_total = total_wins/(total_wins + total_defeats)
+    def record(self, i, rating_formal, rating_actual, probability, lost_probability):
+        total = probability.sum()
+        self.rating_formal_mean[i] = np.dot(rating_formal, probability) / total
+        self.rating_actual_mean[i] = np.dot(rating_actual, probability) / total
+        self.rating_formal_bands[:, i] = get_distribution_percentiles(rating_formal, probability, self.percentiles)
+        self.rating_actual_bands[:, i] = get_distribution_percentiles(rating_actual, probability, self.percentiles)
+        self.states[i] = len(probability)
+        self.lost_probability[i] = lost_probability
+
+    def get_winrate_total(self):
+        # Expected winrate over all games played so far
+        return np.cumsum(self.winrate_game) / (self.game_number + 1)
+
+    def get_winrate_interval(self, window):
+        # Expected winrate of the last window games
+        return get_rolling_winrate(self.winrate_game, window)
+
+def get_distribution_percentiles(values, probability, percentiles):
+    # Smallest value whose cumulative probability reaches every percentile
+    order = np.argsort(values, kind='stable')
+    cumulative = np.cumsum(probability[order])
+    ranks = np.searchsorted(cumulative, np.asarray(percentiles) / 100 * cumulative[-1], side='left')
+    return values[order][np.minimum(ranks, len(order) - 1)]
+
+def solve_distribution(games=games_played_total, percentiles=percentiles_default,
+                       rating_formal=rating_formal_initial, rating_actual=rating_actual_initial, rating_change=rating_change_default,
+                       learning_maximum=learning_maximum_default, learning_minimum=learning_minimum_default,
+                       bin_width=actual_bin_width, tolerance=probability_tolerance):
+    # Propagates the probability of every (formal rating, actual rating) state of simulate_player game by game,
+    # instead of sampling trajectories. The formal rating lives on a lattice of rating_change steps and is exact.
+    # The actual rating is continuous, so it is kept on a grid of bin_width points and each new value is split
+    # between its two neighbouring grid points in proportion to the distance, which keeps the expected value.
+    # States less likely than tolerance are dropped, their total is reported as lost_probability
+    result = DistributionResult(games, percentiles)
+    step = np.zeros(1, dtype=np.int64)
+    actual_bin = np.zeros(1, dtype=np.int64)
+    probability = np.ones(1)
+    lost_probability = 0.0
+
+    for i in range(games):
+        current_formal_rating = rating_formal + rating_change * step
+        current_actual_rating = rating_actual + bin_width * actual_bin
+        chance_to_win = victory_chance(current_actual_rating - current_formal_rating, np.tanh)
+        result.winrate_game[i] = np.dot(chance_to_win, probability) / probability.sum()
+
+        children_step = []
+        children_bin = []
+        children_probability = []
+        for game_result, chance in ((1, chance_to_win), (-1, 1 - chance_to_win)):
+            formal = current_formal_rating + rating_change * game_result
+            actual = current_actual_rating + learning_curve(current_actual_rating, formal, game_result, np.tanh,
+                                                             learning_maximum, learning_minimum)
+            position = (actual - rating_actual) / bin_width
+            lower = np.floor(position)
+            fraction = position - lower
+            lower = lower.astype(np.int64)
+            for bin_offset, weight in ((0, 1 - fraction), (1, fraction)):
+                children_step.append(step + game_result)
+                children_bin.append(lower + bin_offset)
+                children_probability.append(probability * chance * weight)
+
+        # Equal states reached along different paths are merged into one
+        step = np.concatenate(children_step)
+        actual_bin = np.concatenate(children_bin)
+        probability = np.concatenate(children_probability)
+        keys, inverse = np.unique(step * (1 << 32) + actual_bin, return_inverse=True)
+        probability = np.bincount(inverse, weights=probability)
+        actual_bin = (keys + (1 << 31)) % (1 << 32) - (1 << 31)
+        step = (keys - actual_bin) >> 32
+
+        kept = probability >= tolerance
+        lost_probability += probability[~kept].sum()
+        step = step[kept]
+        actual_bin = actual_bin[kept]
+        probability = probability[kept]
+
+        result.record(i, rating_formal + rating_change * step, rating_actual + bin_width * actual_bin, probability, lost_probability)
+
+    return result
+
+class LadderResult:
+    # Calibration of a whole ladder after every round of matchmaking
+    def __init__(self, rounds):
+        self.round_number = np.arange(rounds)
+        self.matches = np.zeros(rounds, dtype=np.int64)
+        self.rating_formal_mean = np.empty(rounds)
+        self.rating_actual_mean = np.empty(rounds)
+        # Pearson correlation of formal and actual rating over all players
+        self.rating_correlation = np.empty(rounds)
+        # Mean actual rating difference between matched opponents, lower means fairer games
+        self.match_gap_mean = np.full(rounds, np.nan)
+        # Share of matches won by the opponent with the higher actual rating
+        self.favourite_winrate = np.full(rounds, np.nan)
+
+        # Per player values after the last round
+        self.rating_formal_final = None
+        self.rating_actual_final = None
+        self.games_played = None
+
+    def record(self, i, rating_formal, rating_actual, actual_gap, favourite_won):
+        self.matches[i] = len(actual_gap)
+        self.rating_formal_mean[i] = rating_formal.mean()
+        self.rating_actual_mean[i] = rating_actual.mean()
+        self.rating_correlation[i] = np.corrcoef(rating_formal, rating_actual)[0, 1]
+        if len(actual_gap) > 0:
+            self.match_gap_mean[i] = actual_gap.mean()
+            self.favourite_winrate[i] = np.count_nonzero(favourite_won) / len(actual_gap)
+
+def find_matches(rating_formal, queued, rng, max_gap=None):
+    # Pairs queued players with their neighbours in formal rating order.
+    # Queued players are shuffled before the stable sort, so players with equal ratings meet in random order.
+    # Pairs further apart than max_gap are not played and the players wait for the next round
+    order = rng.permutation(queued)
+    order = order[np.argsort(rating_formal[order], kind='stable')]
+    count = len(order) // 2 * 2
+    first = order[0:count:2]
+    second = order[1:count:2]
+    if max_gap is not None:
+        close = rating_formal[second] - rating_formal[first] <= max_gap
+        first = first[close]
+        second = second[close]
+    return first, second
+
+def simulate_ladder(players=players_total, rounds=games_played_total, seed=None, queue_ratio=queue_ratio_default, max_gap=None,
+                    rating_formal=rating_formal_initial, rating_actual=rating_actual_initial, actual_spread=rating_actual_spread,
+                    rating_change=rating_change_default, learning_maximum=learning_maximum_default, learning_minimum=learning_minimum_default):
+    # Players with different skill share one formal rating pool and play each other instead of an abstract opponent.
+    # Every round a queue_ratio share of the players queues, the queue is matched in one batch,
+    # and all matches of the round are resolved at once
+    if players < 2:
+        raise ValueError(f"A ladder needs at least 2 players, got {players}")
+
+    rng = np.random.default_rng(seed)
+    current_formal_rating = np.full(players, rating_formal, dtype=np.float64)
+    current_actual_rating = rng.normal(rating_actual, actual_spread, players)
+    games_played = np.zeros(players, dtype=np.int64)
+    result = LadderResult(rounds)
+
+    for i in range(rounds):
+        queued = np.flatnonzero(rng.random(players) < queue_ratio)
+        first, second = find_matches(current_formal_rating, queued, rng, max_gap)
+
+        # Strength of the opponent is their actual rating. It also sets how much each player learns from the game
+        first_actual = current_actual_rating[first]
+        second_actual = current_actual_rating[second]
+        chance_to_win = victory_chance(first_actual - second_actual, np.tanh)
+        game_result = generate_game_results(chance_to_win, rng)
+
+        current_formal_rating[first] += rating_change * game_result
+        current_formal_rating[second] -= rating_change * game_result
+        current_actual_rating[first] += learning_curve(first_actual, second_actual, game_result, np.tanh,
+                                                       learning_maximum, learning_minimum)
+        current_actual_rating[second] += learning_curve(second_actual, first_actual, -game_result, np.tanh,
+                                                        learning_maximum, learning_minimum)
+        games_played[first] += 1
+        games_played[second] += 1
+
+        actual_gap = first_actual - second_actual
+        result.record(i, current_formal_rating, current_actual_rating, np.abs(actual_gap), actual_gap * game_result > 0)
+
+    result.rating_formal_final = current_formal_rating
+    result.rating_actual_final = current_actual_rating
+    result.games_played = games_played
+    return result
+
+def get_pyplot(output=None):
+    # matplotlib is imported only when something is plotted. Plots written to a file use
+    # the non-interactive Agg backend, so they also work without a display
+    import matplotlib
+    if output is not None:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+def show_plot(plt, output=None):
+    if output is None:
+        plt.show()
     else:
-        winrate_interval = None
-        winrate_total = None
+        plt.savefig(output, dpi=150)
+        plt.close()
+
+def get_buckets(values, max_buckets):
+    # Splits values into at most max_buckets rows of equal size, the last row is padded with NaN
+    values = np.asarray(values, dtype=np.float64)
+    bucket_size = -(-len(values) // max_buckets)
+    bucket_count = -(-len(values) // bucket_size)
+    buckets = np.full(bucket_count * bucket_size, np.nan)
+    buckets[:len(values)] = values
+    return buckets.reshape(bucket_count, bucket_size), bucket_size
+
+def downsample_minmax(x_values, y_values, max_points=plot_points_maximum):
+    # Keeps the lowest and the highest point of every bucket in their original order,
+    # so a downsampled line still reaches every peak and dip of the full series
+    if len(y_values) <= max_points:
+        return x_values, y_values
+
+    buckets, bucket_size = get_buckets(y_values, max_points // 2)
+    # NaN (unknown winrate or padding) is never picked over a number
+    unknown = np.isnan(buckets)
+    lowest = np.where(unknown, np.inf, buckets).argmin(axis=1)
+    highest = np.where(unknown, -np.inf, buckets).argmax(axis=1)
+    offsets = np.arange(len(buckets)) * bucket_size
+    indices = np.unique(np.concatenate((lowest + offsets, highest + offsets)))
+    return np.asarray(x_values)[indices], np.asarray(y_values)[indices]
+
+def downsample_band(x_values, lower_values, upper_values, max_points=plot_points_maximum):
+    # Envelope of a band: lowest lower value and highest upper value of every bucket
+    if len(x_values) <= max_points:
+        return x_values, lower_values, upper_values
+
+    lower_buckets, bucket_size = get_buckets(lower_values, max_points)
+    upper_buckets, _ = get_buckets(upper_values, max_points)
+    return np.asarray(x_values)[::bucket_size], np.fmin.reduce(lower_buckets, axis=1), np.fmax.reduce(upper_buckets, axis=1)
+
+def plot_line(plt, x_values, y_values, style, label, max_points=plot_points_maximum, **kwargs):
+    x_values, y_values = downsample_minmax(x_values, y_values, max_points)
+    plt.plot(x_values, y_values, style, label=label, **kwargs)
+
+def plot_bands(plt, x_values, bands, percentiles, color, label, max_points=plot_points_maximum):
+    # Percentiles are paired from the outside in, the middle one (if any) is drawn as a line
+    count = len(percentiles)
+    for j in range(count // 2):
+        band_x_values, lower_values, upper_values = downsample_band(x_values, bands[j], bands[count - 1 - j], max_points)
+        plt.fill_between(band_x_values, lower_values, upper_values, color=color, alpha=0.15, linewidth=0,
+                         label=f"{label} {percentiles[j]}-{percentiles[count - 1 - j]}%" if j == 0 else None)
+    if count % 2 == 1:
+        plot_line(plt, x_values, bands[count // 2], '-', f"{label} {percentiles[count // 2]}%", max_points, color=color)
+
+def plot_history(history, output=None, max_points=plot_points_maximum):
+    # Columns are plotted straight from the store without copying them into lists
+    plt = get_pyplot(output)
+    x_values = history.get_column("game_number")
+
+    plt.figure()
 
-    record = HistoryRecord(i, rating_change, current_actual_rating, current_formal_rating, winrate_interval, winrate_total)
-    history.append(record)
+    plt.subplot(211)
+    plt.ylabel('Rating')
+    plot_line(plt, x_values, history.get_column("rating_actual"), '-b', "Actual rating", max_points)
+    plot_line(plt, x_values, history.get_column("rating_formal"), '-r', "Formal rating", max_points)
+    plt.legend(loc="upper left")
 
-print(f"Overall winrate: {total_wins/(total_wins + total_defeats)}")
+    plt.subplot(212)
+    plt.ylabel(f"Winrate")
+    plt.axhline(y=0.5, color='g', linestyle='-')
+    for window in history.windows:
+        plot_line(plt, x_values, history.get_winrate_interval(window), '-', f"Last {window}", max_points)
+    plot_line(plt, x_values, history.get_column("winrate_total"), '-r', f"Overall", max_points)
+    plt.legend(loc="upper left")
 
-# Plotting
-x_values = []
-actual_rating_values = []
-formal_rating_values = []
-winrate_interval_values = []
-winrate_total_values = []
-for record in history:
-    x_values.append(record.game_number)
-    actual_rating_values.append(record.rating_actual)
-    formal_rating_values.append(record.rating_formal)
-    winrate_interval_values.append(record.winrate_interval)
-    winrate_total_values.append(record.winrate_total)
+    show_plot(plt, output)
 
-plt.figure()
+def plot_population(result, windows=(winrate_interval_param,), output=None, max_points=plot_points_maximum):
+    plt = get_pyplot(output)
+    plt.figure()
 
-plt.subplot(211)
-plt.ylabel('Rating')
-plt.plot(x_values, actual_rating_values, '-b', label="Actual rating")
-plt.plot(x_values, formal_rating_values, '-r', label="Formal rating")
-plt.legend(loc="upper left")
+    plt.subplot(211)
+    plt.ylabel('Rating')
+    plot_bands(plt, result.game_number, result.rating_actual_bands, result.percentiles, 'b', "Actual rating", max_points)
+    plot_bands(plt, result.game_number, result.rating_formal_bands, result.percentiles, 'r', "Formal rating", max_points)
+    plt.legend(loc="upper left")
 
-plt.subplot(212)
-plt.ylabel(f"Winrate")
-plt.axhline(y=0.5, color='g', linestyle='-')
-plt.plot(x_values, winrate_interval_values, '-b', label=f"Last {winrate_interval_param}")
-plt.plot(x_values, winrate_total_values, '-r', label=f"Overall")
-plt.legend(loc="upper left")
+    plt.subplot(212)
+    plt.ylabel(f"Winrate")
+    plt.axhline(y=0.5, color='g', linestyle='-')
+    for window in windows:
+        plot_line(plt, result.game_number, result.get_winrate_interval(window), '-', f"Last {window}", max_points)
+    plot_bands(plt, result.game_number, result.winrate_total_bands, result.percentiles, 'r', "Overall", max_points)
+    plt.legend(loc="upper left")
 
-plt.show()
+    show_plot(plt, output)
 
+def plot_distribution(result, windows=(winrate_interval_param,), output=None, max_points=plot_points_maximum):
+    plt = get_pyplot(output)
+    plt.figure()
 
+    plt.subplot(211)
+    plt.ylabel('Rating')
+    plot_bands(plt, result.game_number, result.rating_actual_bands, result.percentiles, 'b', "Actual rating", max_points)
+    plot_bands(plt, result.game_number, result.rating_formal_bands, result.percentiles, 'r', "Formal rating", max_points)
+    plt.legend(loc="upper left")
+
+    plt.subplot(212)
+    plt.ylabel(f"Winrate")
+    plt.axhline(y=0.5, color='g', linestyle='-')
+    for window in windows:
+        plot_line(plt, result.game_number, result.get_winrate_interval(window), '-', f"Last {window}", max_points)
+    plot_line(plt, result.game_number, result.get_winrate_total(), '-r', f"Overall", max_points)
+    plt.legend(loc="upper left")
+
+    show_plot(plt, output)
+
+def plot_ladder(result, output=None, max_points=plot_points_maximum):
+    plt = get_pyplot(output)
+    plt.figure()
+
+    plt.subplot(211)
+    plt.ylabel('Correlation')
+    plot_line(plt, result.round_number, result.rating_correlation, '-b', "Formal and actual rating", max_points)
+    plt.legend(loc="upper left")
+
+    plt.subplot(212)
+    plt.ylabel(f"Winrate")
+    plt.axhline(y=0.5, color='g', linestyle='-')
+    plot_line(plt, result.round_number, result.favourite_winrate, '-r', "Stronger opponent", max_points)
+    plt.legend(loc="upper left")
+
+    show_plot(plt, output)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulates formal and actual rating of players over many games")
+    parser.add_argument("--players", type=int, default=None,
+                        help=f"simulate a population of players and plot percentile bands (default: 1, or {players_total} with --ladder)")
+    parser.add_argument("--games", type=int, default=games_played_total)
+    parser.add_argument("--exact", action="store_true", help="solve the distribution of one player instead of sampling")
+    parser.add_argument("--bin-width", type=float, default=actual_bin_width, help="actual rating resolution of --exact")
+    parser.add_argument("--ladder", action="store_true", help="match the players against each other instead")
+    parser.add_argument("--rounds", type=int, default=games_played_total, help="matchmaking rounds of the ladder")
+    parser.add_argument("--queue-ratio", type=float, default=queue_ratio_default, help="share of the ladder queued per round")
+    parser.add_argument("--windows", type=int, nargs="+", default=[winrate_interval_param], help="games per rolling winrate")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--save", default=None, help="directory to save the single player history to")
+    parser.add_argument("--load", default=None, help="plot a saved history instead of simulating")
+    parser.add_argument("--plot-output", default=None, help="write the plot to this image file instead of showing it")
+    parser.add_argument("--plot-points", type=int, default=plot_points_maximum, help="points per plotted line after downsampling")
+    parser.add_argument("--no-plot", action="store_true", help="only print the summary")
+    args = parser.parse_args()
+
+    if args.players is None:
+        args.players = players_total if args.ladder else 1
+    if args.ladder and args.players < 2:
+        parser.error("--ladder needs at least 2 players")
+
+    if args.load:
+        history = HistoryStore.load(args.load)
+        print(f"Overall winrate: {np.count_nonzero(history.get_column('rating_change') > 0) / len(history)}")
+        if not args.no_plot:
+            plot_history(history, args.plot_output, args.plot_points)
+    elif args.exact:
+        result = solve_distribution(args.games, bin_width=args.bin_width)
+        print(f"Expected overall winrate: {result.get_winrate_total()[-1]}")
+        print(f"Probability dropped below the tolerance: {result.lost_probability[-1]}")
+        if not args.no_plot:
+            plot_distribution(result, args.windows, args.plot_output, args.plot_points)
+    elif args.ladder:
+        start = time.perf_counter()
+        result = simulate_ladder(args.players, args.rounds, args.seed, args.queue_ratio)
+        elapsed = time.perf_counter() - start
+        print(f"Matches: {result.matches.sum()} in {elapsed:.1f} s ({result.matches.sum() / elapsed * 60:.0f} per minute)")
+        print(f"Final correlation of formal and actual rating: {result.rating_correlation[-1]}")
+        if not args.no_plot:
+            plot_ladder(result, args.plot_output, args.plot_points)
+    elif args.players > 1:
+        result = simulate_population(args.players, args.games, args.seed)
+        print(f"Overall winrate: {result.wins.sum() / (args.players * args.games)}")
+        if not args.no_plot:
+            plot_population(result, args.windows, args.plot_output, args.plot_points)
+    else:
+        random.seed(args.seed)
+        history, total_wins, total_defeats = simulate_player(args.games, args.windows)
+        print(f"Overall winrate: {total_wins/(total_wins + total_defeats)}")
+        if args.save:
+            history.save(args.save)
+        if not args.no_plot:
+            plot_history(history, args.plot_output, args.plot_points)
@@ -0,0 +1,200 @@
+from DotaRating import simulate_population
+import DotaRating
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import numpy as np
+
+# Model constants that can be swept, named after the simulate_population arguments
+PARAMETER_NAMES = ("rating_change", "rating_formal", "rating_actual", "learning_maximum", "learning_minimum")
+METRIC_NAMES = ("convergence_game", "final_gap", "winrate", "rating_formal_final", "rating_actual_final")
+
+def get_default_parameters():
+    return {
+        "rating_change": DotaRating.rating_change_default,
+        "rating_formal": DotaRating.rating_formal_initial,
+        "rating_actual": DotaRating.rating_actual_initial,
+        "learning_maximum": DotaRating.learning_maximum_default,
+        "learning_minimum": DotaRating.learning_minimum_default,
+    }
+
+def get_grid_points(grid):
+    # Every combination of the listed values, parameters that are not in grid keep their defaults
+    names = list(grid)
+    points = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        point = get_default_parameters()
+        point.update(zip(names, values))
+        points.append(point)
+    return points
+
+def get_random_points(ranges, count, seed=0):
+    # Uniform samples from the (low, high) range of every parameter in ranges
+    rng = random.Random(seed)
+    points = []
+    for _ in range(count):
+        point = get_default_parameters()
+        for name, (low, high) in ranges.items():
+            point[name] = rng.uniform(low, high)
+        points.append(point)
+    return points
+
+def get_point_key(point, players, games, seed, convergence_gap):
+    # Identifies a finished simulation in the cache. The seed of a point is derived from this key,
+    # so results do not depend on the order or process a point runs in
+    point = {name: float(value) for name, value in point.items()}
+    description = {"point": point, "players": players, "games": games, "seed": seed, "convergence_gap": convergence_gap}
+    return hashlib.sha1(json.dumps(description, sort_keys=True).encode("utf-8")).hexdigest()
+
+def summarize(result, convergence_gap):
+    # convergence_game is the first game after which the mean formal rating stays within
+    # convergence_gap of the mean actual rating, or None if it never settles
+    gap = result.rating_formal_mean - result.rating_actual_mean
+    outside = np.flatnonzero(np.abs(gap) > convergence_gap)
+    if len(outside) == 0:
+        convergence_game = 0
+    elif outside[-1] + 1 < len(gap):
+        convergence_game = int(outside[-1] + 1)
+    else:
+        convergence_game = None
+
+    return {
+        "convergence_game": convergence_game,
+        "final_gap": float(gap[-1]),
+        "winrate": float(result.wins.sum() / (result.players * len(result.game_number))),
+        "rating_formal_final": float(result.rating_formal_mean[-1]),
+        "rating_actual_final": float(result.rating_actual_mean[-1]),
+    }
+
+def run_point(task):
+    key, point, players, games, seed, convergence_gap = task
+    seed_sequence = np.random.SeedSequence([seed, int(key[:16], 16)])
+    result = simulate_population(players, games, seed_sequence, percentiles=(), **point)
+    return key, summarize(result, convergence_gap)
+
+class SweepCache:
+    # Finished grid points, one JSON object per line. Every point is appended as soon as it finishes,
+    # so an interrupted sweep resumes where it stopped
+    def __init__(self, path):
+        self.path = path
+        self.metrics = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by an interrupted run is simulated again
+                        continue
+                    self.metrics[entry["key"]] = entry["metrics"]
+
+    def get(self, key):
+        return self.metrics.get(key)
+
+    def add(self, key, metrics, stream):
+        self.metrics[key] = metrics
+        if stream is not None:
+            stream.write(json.dumps({"key": key, "metrics": metrics}) + "\n")
+            stream.flush()
+
+def run_sweep(points, players=10000, games=DotaRating.games_played_total, seed=0, processes=1,
+              cache_path="SweepCache.jsonl", convergence_gap=100):
+    # Simulates every point that is not cached yet and returns one row of parameters and metrics per point
+    cache = SweepCache(cache_path)
+    keys = [get_point_key(point, players, games, seed, convergence_gap) for point in points]
+    tasks = {}
+    for key, point in zip(keys, points):
+        if cache.get(key) is None and key not in tasks:
+            tasks[key] = (key, point, players, games, seed, convergence_gap)
+
+    stream = open(cache_path, "a") if cache_path else None
+    try:
+        if processes == 1 or len(tasks) <= 1:
+            for task in tasks.values():
+                cache.add(*run_point(task), stream)
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                for key, metrics in pool.imap_unordered(run_point, tasks.values()):
+                    cache.add(key, metrics, stream)
+    finally:
+        if stream is not None:
+            stream.close()
+
+    rows = []
+    for key, point in zip(keys, points):
+        row = dict(point)
+        row.update(cache.get(key))
+        rows.append(row)
+    return rows
+
+def write_table(rows, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(PARAMETER_NAMES + METRIC_NAMES))
+        writer.writeheader()
+        writer.writerows(rows)
+
+def parse_values(text):
+    return [float(value) for value in text.split(",")]
+
+def parse_assignments(assignments):
+    # "name=1,2,3" arguments into a dict of value lists
+    parsed = {}
+    for assignment in assignments:
+        name, _, values = assignment.partition("=")
+        if name not in PARAMETER_NAMES:
+            raise ValueError(f"Unknown parameter {name}, expected one of {', '.join(PARAMETER_NAMES)}")
+        parsed[name] = parse_values(values)
+    return parsed
+
+def parse_ranges(assignments):
+    # "name=low,high" arguments into a dict of (low, high) tuples
+    ranges = {}
+    for name, values in parse_assignments(assignments).items():
+        if len(values) != 2:
+            raise ValueError(f"Range of {name} needs exactly two values LOW,HIGH, got {len(values)}")
+        ranges[name] = tuple(values)
+    return ranges
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs DotaRating simulations over a grid or random sample of model constants")
+    parser.add_argument("--grid", nargs="+", default=[], metavar="NAME=V1,V2", help="values of a parameter to combine")
+    parser.add_argument("--range", nargs="+", default=[], metavar="NAME=LOW,HIGH", help="range of a parameter to sample")
+    parser.add_argument("--samples", type=int, default=0, help="random points drawn from the --range parameters")
+    parser.add_argument("--players", type=int, default=10000, help="players simulated per point")
+    parser.add_argument("--games", type=int, default=DotaRating.games_played_total)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--convergence-gap", type=float, default=100, help="rating gap that counts as converged")
+    parser.add_argument("-j", "--processes", type=int, default=1, help="worker processes, 0 for all cores")
+    parser.add_argument("--cache", default="SweepCache.jsonl", help="finished points, empty to disable")
+    parser.add_argument("--output", default="SweepResults.csv")
+    args = parser.parse_args()
+
+    if args.range and args.samples <= 0:
+        parser.error("--range needs a positive --samples")
+    if args.samples and not args.range:
+        parser.error("--samples needs at least one --range")
+
+    try:
+        grid = parse_assignments(args.grid)
+        ranges = parse_ranges(args.range)
+    except ValueError as error:
+        parser.error(str(error))
+
+    points = []
+    if args.grid or not args.samples:
+        points += get_grid_points(grid)
+    if args.samples:
+        points += get_random_points(ranges, args.samples, args.seed)
+
+    rows = run_sweep(points, args.players, args.games, args.seed, args.processes or None,
+                     args.cache or None, args.convergence_gap)
+    write_table(rows, args.output)
+    print(f"{len(rows)} points written to {args.output}")
@@ -0,0 +1,210 @@
+import PythonExperiments
+import argparse
+import csv
+import filecmp
+import itertools
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+# Code symbols for generated alphabets. Space and '_' are left out so generated codes
+# never collide with the separator or the '___' word code
+CODE_SYMBOLS = "|/\\()<>[]{}!#$%&*+=-~^:;'`\"0123456789"
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+BLOCK_SIZE = 1 << 20
+
+def generate_alphabet(letters=26, variants=1, code_length=2, seed=0):
+    # Fixed-length codes are prefix-free, so every generated alphabet respects the Phano rule
+    if letters * variants > len(CODE_SYMBOLS) ** code_length:
+        return None
+
+    rng = random.Random(seed)
+    codes = set()
+    while len(codes) < letters * variants:
+        codes.add("".join(rng.choice(CODE_SYMBOLS) for _ in range(code_length)))
+
+    codes = sorted(codes)
+    rng.shuffle(codes)
+    return [codes[i * variants:(i + 1) * variants] if variants > 1 else codes[i] for i in range(letters)]
+
+def generate_unit(size, seed, letters=26):
+    # Lowercase words, each followed by a single space
+    rng = random.Random(seed)
+    alphabet = LETTERS[:letters]
+    words = []
+    length = 0
+    while length < size:
+        word = "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 10)))
+        words.append(word + " ")
+        length += len(word) + 1
+    return "".join(words)
+
+def finish_corpus(corpus):
+    # A trailing space would not survive the round trip
+    if corpus.endswith(" "):
+        corpus = corpus[:-1] + "x"
+    return corpus
+
+def generate_corpus(size, seed=0, letters=26):
+    # Large corpora repeat one random block of words to keep generation fast
+    unit = generate_unit(min(size, BLOCK_SIZE), seed, letters)
+    return finish_corpus((unit * (size // len(unit) + 1))[:size])
+
+def write_corpus_file(path, size, seed=0, letters=26):
+    # Same text as generate_corpus, written block by block
+    unit = generate_unit(min(size, BLOCK_SIZE), seed, letters)
+    written = 0
+    with open(path, "w", newline="") as f:
+        while written < size:
+            piece = unit[:size - written]
+            written += len(piece)
+            f.write(finish_corpus(piece) if written == size else piece)
+
+def reference_respects_phano(codes):
+    # Pairwise check of the original implementation, extended to variants
+    variants = PythonExperiments.get_code_variants(codes)
+    for i, j in itertools.product(range(len(variants)), repeat=2):
+        for code, other in itertools.product(variants[i], variants[j]):
+            if (i != j or code != other) and code.startswith(other):
+                return False, i, j
+    return True, None, None
+
+def measure(function, repeat, trace_memory):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return best, peak, result
+
+def benchmark_in_memory(codes, size, seed, repeat, trace_memory):
+    PythonExperiments.alphabet = codes
+    corpus = generate_corpus(size, seed)
+
+    encode_time, encode_peak, leet = measure(lambda: PythonExperiments.forward_conversion(corpus), repeat, trace_memory)
+    decode_time, decode_peak, text = measure(lambda: PythonExperiments.backward_conversion(leet), repeat, trace_memory)
+    round_trip = text == corpus
+
+    return [
+        ("forward_conversion", len(corpus), encode_time, encode_peak, round_trip),
+        ("backward_conversion", len(leet), decode_time, decode_peak, round_trip),
+    ]
+
+def benchmark_stream(codes, size, seed, chunk_size, processes, trace_memory):
+    PythonExperiments.alphabet = codes
+    with tempfile.TemporaryDirectory() as directory:
+        text_path = os.path.join(directory, "corpus.txt")
+        leet_path = os.path.join(directory, "corpus.leet")
+        decoded_path = os.path.join(directory, "corpus.decoded")
+        write_corpus_file(text_path, size, seed)
+
+        def convert(mode, input_path, output_path):
+            if processes == 1:
+                return PythonExperiments.run_stream(mode, input_path, output_path, chunk_size)
+            return PythonExperiments.batch_convert_file(input_path, output_path, mode, processes, chunk_size)
+
+        encode_time, encode_peak, _ = measure(lambda: convert("encode", text_path, leet_path), 1, trace_memory)
+        decode_time, decode_peak, _ = measure(lambda: convert("decode", leet_path, decoded_path), 1, trace_memory)
+        round_trip = filecmp.cmp(text_path, decoded_path, shallow=False)
+        leet_size = os.path.getsize(leet_path)
+
+    return [
+        ("stream encode", size, encode_time, encode_peak, round_trip),
+        ("stream decode", leet_size, decode_time, decode_peak, round_trip),
+    ]
+
+def benchmark_phano(codes, repeat):
+    # Compiling a fresh codec measures validation without the per-alphabet cache
+    elapsed, _, result = measure(lambda: PythonExperiments.LeetCodec(codes).respects_phano(), repeat, False)
+    reference = reference_respects_phano(codes) if len(codes) <= 3000 else result
+    return ("respects_phano", len(codes), elapsed, None, result == reference)
+
+def get_sizes(min_size, max_size):
+    sizes = []
+    size = min_size
+    while size <= max_size:
+        sizes.append(size)
+        size *= 4
+    return sizes
+
+def make_row(alphabet, function, items, elapsed, peak, correct):
+    # items are characters for conversions and codes for respects_phano
+    rate = items / elapsed if elapsed > 0 else float("inf")
+    row = {"alphabet": alphabet, "function": function, "items": items, "seconds": elapsed,
+           "items_per_second": rate, "peak_bytes": peak, "correct": correct}
+
+    unit = "codes" if function == "respects_phano" else "chars"
+    peak = "-" if peak is None else f"{peak / (1 << 20):10.2f} MB"
+    status = "ok" if correct else "MISMATCH"
+    print(f"{alphabet:<24} {function:<20} {items:>12} {unit}  {elapsed:10.4f} s  {rate:14.0f} {unit}/s  {peak:>13}  {status}")
+    return row
+
+def run_benchmarks(alphabets, sizes, seed, repeat, trace_memory, stream=False, chunk_size=1 << 20, processes=1):
+    rows = []
+    original_alphabet = PythonExperiments.alphabet
+    try:
+        for name, codes in alphabets:
+            results = [benchmark_phano(codes, repeat)]
+            for size in sizes:
+                if stream:
+                    results.extend(benchmark_stream(codes, size, seed, chunk_size, processes, trace_memory))
+                else:
+                    results.extend(benchmark_in_memory(codes, size, seed, repeat, trace_memory))
+
+            for result in results:
+                rows.append(make_row(name, *result))
+    finally:
+        PythonExperiments.alphabet = original_alphabet
+    return rows
+
+def get_alphabets(variant_counts, code_lengths, seed):
+    alphabets = [("default", list(PythonExperiments.alphabet))]
+    for variants, code_length in itertools.product(variant_counts, code_lengths):
+        codes = generate_alphabet(26, variants, code_length, seed)
+        if codes is not None:
+            alphabets.append((f"{variants} variants x {code_length} chars", codes))
+    return alphabets
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and memory benchmark of the leet codec")
+    parser.add_argument("--min-size", type=int, default=1 << 10, help="smallest corpus in characters")
+    parser.add_argument("--max-size", type=int, default=1 << 24, help="largest corpus, sizes grow by 4x (up to 1 << 30)")
+    parser.add_argument("--variants", type=int, nargs="+", default=[1, 4], help="code variants per letter")
+    parser.add_argument("--code-lengths", type=int, nargs="+", default=[1, 2, 4], help="characters per generated code")
+    parser.add_argument("--phano-sizes", type=int, nargs="+", default=[26, 260, 2600], help="alphabet sizes for respects_phano alone")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement, the best one is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak memory runs")
+    parser.add_argument("--stream", action="store_true", help="benchmark the chunked file mode instead of in-memory strings")
+    parser.add_argument("--chunk-size", type=int, default=1 << 20)
+    parser.add_argument("-j", "--processes", type=int, default=1, help="worker processes for the file mode, 0 for all cores")
+    parser.add_argument("--csv", default=None, help="also write the results to this CSV file")
+    args = parser.parse_args()
+
+    alphabets = get_alphabets(args.variants, args.code_lengths, args.seed)
+    rows = run_benchmarks(alphabets, get_sizes(args.min_size, args.max_size), args.seed, args.repeat,
+                          not args.no_memory, args.stream, args.chunk_size, args.processes or None)
+
+    for size in args.phano_sizes:
+        length = 1
+        while len(CODE_SYMBOLS) ** length < size:
+            length += 1
+        codes = generate_alphabet(size, 1, length + 1, args.seed)
+        rows.append(make_row(f"{size} codes x {length + 1} chars", *benchmark_phano(codes, args.repeat)))
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
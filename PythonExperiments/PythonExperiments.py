@@ -1,3 +1,11 @@
+import argparse
+import mmap
+import multiprocessing
+import os
+import random
+import sys
+from random import choice
+
 alphabet = [
     '4',    # A
     '6',    # B
@@ -27,23 +35,19 @@ alphabet = [
     '2'     # Z
 ]
 
+# forward_conversion writes this code for a space between words
+space_code = '___'
+
 def get_leet_for_char(current_char):
     index = ord(current_char) - 65
-    sub_alphabet = alphabet[index]
+    sub_alphabet = get_codec().variants[index]
     leet_symbol = choice(sub_alphabet)
 
     return leet_symbol
 
 
 def respects_phano():
-    for i in range(len(alphabet)):
-        for j in range(len(alphabet)):
-            if i == j:
-                continue
-            if alphabet[i].startswith(alphabet[j]):
-                return False, i, j
-
-    return True, None, None
+    return get_codec().respects_phano()
 
 def get_index_of_letter(letter):
     symbol = letter.lower()
@@ -54,59 +58,443 @@ def get_letter_from_index(index):
     ascii_code = index + ord('a')
     return chr(ascii_code)
 
+class EncoderTable(dict):
+    # str.translate table mapping code points to "code ", filled on first use of each
+    # character. Characters without a code map to None, which translate drops
+
+    def __init__(self, codes):
+        super().__init__()
+        self.codes = codes
+        self[ord(' ')] = space_code + ' '
+
+    def __missing__(self, codepoint):
+        symbol = chr(codepoint)
+        code = None
+        if len(symbol.lower()) == 1:
+            index = get_index_of_letter(symbol)
+            if 0 <= index < len(self.codes):
+                code = self.codes[index] + ' '
+        self[codepoint] = code
+        return code
+
 def forward_conversion(text):
-    result = ""
-    for i in text:
-        index = get_index_of_letter(i)
-
-        if i == ' ':
-            result += '___ '
-        elif index < 0 or index > len(alphabet):
-            pass
-        else:
-            result += alphabet[index] + ' '
-    return result
+    return get_codec().encode(text)
+
+class TrieNode:
+    __slots__ = ("children", "letter", "indices", "ambiguous")
+
+    def __init__(self):
+        self.children = {}
+        self.letter = None
+        # Alphabet indices of every code ending here
+        self.indices = []
+        # True if the code ending here is duplicated or is a prefix of another code
+        self.ambiguous = False
+
+def get_code_variants(codes):
+    # An alphabet entry is either one code or a list of interchangeable codes
+    return [(entry,) if isinstance(entry, str) else tuple(entry) for entry in codes]
+
+def build_decoder_trie(codes):
+    root = TrieNode()
+    entries = []
+    for index, variants in enumerate(get_code_variants(codes)):
+        for code in variants:
+            entries.append((index, get_letter_from_index(index), code))
+    entries.append((None, ' ', space_code))
+
+    for index, letter, code in entries:
+        node = root
+        for symbol in code:
+            if node.letter is not None:
+                node.ambiguous = True
+            node = node.children.setdefault(symbol, TrieNode())
+
+        if (node.letter is not None and node.letter != letter) or node.children:
+            node.ambiguous = True
+        if node.letter is None:
+            node.letter = letter
+        if index is not None:
+            node.indices.append(index)
+
+    return root
+
+def find_phano_violation(trie, variants):
+    # Same answer as comparing every pair of codes: the first code i that starts
+    # with another code j, with the smallest such j, but one walk per code
+    for i, codes in enumerate(variants):
+        prefix_index = None
+        for code in codes:
+            node = trie
+            for depth, symbol in enumerate(code):
+                node = node.children[symbol]
+                for j in node.indices:
+                    if j == i and depth == len(code) - 1:
+                        continue
+                    if prefix_index is None or j < prefix_index:
+                        prefix_index = j
+        if prefix_index is not None:
+            return False, i, prefix_index
+
+    return True, None, None
+
+class LeetCodec:
+    # Compiled codec for one alphabet: encoder table, decoder trie and the prefix
+    # check are built once. Obtain instances through get_codec to share them
+
+    def __init__(self, codes):
+        self.variants = get_code_variants(codes)
+        self.codes = [variants[0] for variants in self.variants]
+        self.trie = build_decoder_trie(self.variants)
+        self.phano = find_phano_violation(self.trie, self.variants)
+        self.encoder_table = EncoderTable(self.codes)
+
+        # "code " of letters with several variants mapped to all of their variants
+        self.variant_table = {}
+        for variants in self.variants:
+            if len(variants) > 1:
+                self.variant_table[variants[0] + ' '] = [code + ' ' for code in variants]
+
+    def respects_phano(self):
+        return self.phano
+
+    def encode(self, text, rng=None):
+        # Without rng every letter gets its first variant. With a seed or random.Random
+        # the variants are drawn per letter in one batch.
+        # Byte buffers are encoded byte by byte as Latin-1, so anything but ASCII letters is skipped
+        if isinstance(text, (bytes, bytearray, memoryview)):
+            return self.encode(bytes(text).decode('latin-1'), rng).encode('latin-1')
+
+        if rng is None or not self.variant_table:
+            return text.translate(self.encoder_table)
+
+        if not isinstance(rng, random.Random):
+            rng = random.Random(rng)
+
+        parts = []
+        positions = {}
+        encoder_table = self.encoder_table
+        for symbol in text:
+            code = encoder_table[ord(symbol)]
+            if code is None:
+                continue
+            if code in self.variant_table:
+                positions.setdefault(code, []).append(len(parts))
+            parts.append(code)
+
+        for code, code_positions in positions.items():
+            drawn = rng.choices(self.variant_table[code], k=len(code_positions))
+            for position, variant in zip(code_positions, drawn):
+                parts[position] = variant
+
+        return "".join(parts)
+
+    def decode(self, leet):
+        return decode_leet(leet, self.trie)
+
+    def stream_decoder(self):
+        return LeetStreamDecoder(self.trie)
+
+compiled_codecs = {}
+
+def get_codec(codes=None):
+    if codes is None:
+        codes = alphabet
+    key = tuple(get_code_variants(codes))
+    codec = compiled_codecs.get(key)
+    if codec is None:
+        codec = LeetCodec(codes)
+        compiled_codecs[key] = codec
+    return codec
+
+class LeetStreamDecoder:
+    # Incremental decoder: feed() accepts the input in chunks of any size and keeps
+    # partial codes and pending spaces across chunk boundaries. A lone space separates
+    # codes and is dropped, in a run of spaces every space but the last one is kept.
+    # Line breaks are skipped. Problems are collected in errors as (position, sequence, reason)
+
+    def __init__(self, trie=None):
+        self.trie = get_codec().trie if trie is None else trie
+        self.node = self.trie
+        self.offset = 0
+        self.code_start = 0
+        self.carried = ""
+        self.pending_space = False
+        self.errors = []
+
+    def feed(self, chunk):
+        trie = self.trie
+        node = self.node
+        offset = self.offset
+        code_start = self.code_start
+        carried = self.carried
+        pending_space = self.pending_space
+        errors = self.errors
+
+        result = []
+        local_start = 0
+
+        for i, symbol in enumerate(chunk):
+            if symbol == ' ':
+                if pending_space:
+                    result.append(' ')
+                pending_space = True
+                continue
+            if symbol == '\n' or symbol == '\r':
+                continue
+            pending_space = False
+
+            child = node.children.get(symbol)
+            if child is None and node is not trie:
+                errors.append((code_start, carried + chunk[local_start:i], "unmatched"))
+                node = trie
+                child = trie.children.get(symbol)
+            if child is None:
+                errors.append((offset + i, symbol, "unmatched"))
+                continue
+            if node is trie:
+                code_start = offset + i
+                local_start = i
+                carried = ""
+
+            if child.letter is None:
+                node = child
+                continue
+
+            if child.ambiguous:
+                errors.append((code_start, carried + chunk[local_start:i + 1], "ambiguous"))
+            result.append(child.letter)
+            node = trie
+
+        self.node = node
+        self.offset = offset + len(chunk)
+        self.code_start = code_start
+        self.carried = carried + chunk[local_start:] if node is not trie else ""
+        self.pending_space = pending_space
+        return "".join(result)
+
+    def finish(self):
+        if self.node is not self.trie:
+            self.errors.append((self.code_start, self.carried, "unmatched"))
+        self.node = self.trie
+        self.carried = ""
+        self.pending_space = False
+        return ""
+
+def decode_leet(leet, trie=None):
+    # Returns the text and a list of (position, sequence, reason) errors
+    decoder = LeetStreamDecoder(trie)
+    text = decoder.feed(leet)
+    text += decoder.finish()
+    return text, decoder.errors
 
 def backward_conversion(leet_untrimmed):
-    leet = ""
-    for i, symbol in enumerate(leet_untrimmed):
-        if symbol != ' ' or i == len(leet) - 1:
-            leet += symbol
-        elif leet_untrimmed[i + 1] == ' ':
-            leet += ' '
-
-    result = ""
-
-    code_accumulator = ""
-    for i, symbol in enumerate(leet):
-
-        if symbol == " ":
-            result += " "
-            continue
-
-        code_accumulator += symbol
-        code_match = False
-        for code_index, code in enumerate(alphabet):
-            if code_accumulator == code:                
-                code_match = True
-                letter = get_letter_from_index(code_index)
-                result += letter
-                break
-        if code_match:
-            code_accumulator = ""      
-
-    return result
-
-
-phano_respected, codeA, codeB = respects_phano()
-if not phano_respected:
-    print(f"Warning! Phano rule is violated by {get_letter_from_index(codeA)} {alphabet[codeA]} and {get_letter_from_index(codeB)} {alphabet[codeB]}")
-
-while True:
-    text = input("Text: ")    
-    leet = forward_conversion(text)
-    print(leet)
-
-    leet = input("Leet: ")
-    text = backward_conversion(leet)
-    print(text)
\ No newline at end of file
+    text, _ = decode_leet(leet_untrimmed)
+    return text
+
+def iterate_file_chunks(path, chunk_size):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for offset in range(0, len(mapped), chunk_size):
+                yield mapped[offset:offset + chunk_size]
+
+def iterate_stream_chunks(stream, chunk_size):
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+def report_decoding_errors(errors, stream):
+    for position, sequence, reason in errors:
+        print(f"Warning! {reason} sequence {sequence!r} at {position}", file=stream)
+
+def convert_stream(chunks, output, mode, error_stream=sys.stderr, codec=None):
+    # Works on byte chunks, which are treated as Latin-1 text. Returns the number of decoding errors
+    if codec is None:
+        codec = get_codec()
+
+    if mode == 'encode':
+        for chunk in chunks:
+            output.write(codec.encode(chunk))
+        return 0
+
+    error_count = 0
+    decoder = codec.stream_decoder()
+    for chunk in chunks:
+        output.write(decoder.feed(chunk.decode('latin-1')).encode('latin-1'))
+        report_decoding_errors(decoder.errors, error_stream)
+        error_count += len(decoder.errors)
+        decoder.errors.clear()
+
+    output.write(decoder.finish().encode('latin-1'))
+    report_decoding_errors(decoder.errors, error_stream)
+    return error_count + len(decoder.errors)
+
+def find_piece_boundaries(data, piece_size, mode):
+    # Splits str, bytes or mmap data into (start, end) pieces of about piece_size.
+    # Encoded text is split after a space. Leet is split after a word separator
+    # followed by a code, where a fresh decoder starts in the same state as a running one
+    separator = space_code + ' ' if mode == 'decode' else ' '
+    blanks = (' ', '\r', '\n')
+    if not isinstance(data, str):
+        separator = separator.encode('latin-1')
+        blanks = tuple(blank.encode('latin-1') for blank in blanks)
+
+    boundaries = [0]
+    target = piece_size
+    while target < len(data):
+        position = data.find(separator, target)
+        while position != -1 and mode == 'decode' and data[position + len(separator):position + len(separator) + 1] in blanks:
+            position = data.find(separator, position + 1)
+        if position == -1 or position + len(separator) >= len(data):
+            break
+
+        boundary = position + len(separator)
+        boundaries.append(boundary)
+        target = boundary + piece_size
+
+    boundaries.append(len(data))
+    return list(zip(boundaries, boundaries[1:]))
+
+batch_codec = None
+
+def init_batch_worker(codes):
+    global batch_codec
+    batch_codec = get_codec(codes)
+
+def encode_piece(piece):
+    return batch_codec.encode(piece)
+
+def decode_piece(piece):
+    # The piece is only valid on its own if decoding ends between codes
+    decoder = batch_codec.stream_decoder()
+    text = decoder.feed(piece)
+    clean = decoder.node is decoder.trie
+    decoder.finish()
+    return text, decoder.errors, clean
+
+def convert_file_piece(task):
+    path, start, end, mode = task
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            piece = mapped[start:end]
+
+    if mode == 'encode':
+        return encode_piece(piece), [], True
+
+    text, errors, clean = decode_piece(piece.decode('latin-1'))
+    return text.encode('latin-1'), errors, clean
+
+def create_batch_pool(processes, codes):
+    return multiprocessing.Pool(processes, initializer=init_batch_worker, initargs=(get_codec(codes).variants,))
+
+def batch_forward_conversion(texts, processes=None, piece_size=1 << 20, codes=None):
+    # texts is a list of strings, converted one by one, or one large string split into pieces.
+    # The result is the same as forward_conversion on each input
+    with create_batch_pool(processes, codes) as pool:
+        if not isinstance(texts, str):
+            return pool.map(encode_piece, texts)
+
+        pieces = [texts[start:end] for start, end in find_piece_boundaries(texts, piece_size, 'encode')]
+        return "".join(pool.imap(encode_piece, pieces))
+
+def batch_backward_conversion(leets, processes=None, piece_size=1 << 20, codes=None):
+    # leets is a list of strings, converted one by one, or one large string split at word
+    # separators. The result is the same as backward_conversion on each input
+    with create_batch_pool(processes, codes) as pool:
+        if not isinstance(leets, str):
+            return [text for text, _, _ in pool.map(decode_piece, leets)]
+
+        pieces = [leets[start:end] for start, end in find_piece_boundaries(leets, piece_size, 'decode')]
+        results = pool.map(decode_piece, pieces)
+
+    # A piece ending inside a code means the split was not at a code boundary, e.g. in
+    # malformed input. Such input is decoded in one piece instead
+    if not all(clean for _, _, clean in results):
+        return get_codec(codes).decode(leets)[0]
+    return "".join(text for text, _, _ in results)
+
+def batch_convert_file(input_path, output_path, mode, processes=None, piece_size=16 << 20, codes=None, error_stream=sys.stderr):
+    # Pieces are read by the workers straight from the memory-mapped input and written
+    # in order as they complete. Returns the number of decoding errors
+    with open(input_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            boundaries = []
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                boundaries = find_piece_boundaries(mapped, piece_size, mode)
+
+    tasks = [(input_path, start, end, mode) for start, end in boundaries]
+    # Errors are only reported once every piece came back clean, the sequential
+    # fallback below reports all of them again otherwise
+    all_errors = []
+    with open(output_path, 'wb') as output:
+        with create_batch_pool(processes, codes) as pool:
+            for (start, _), (data, errors, clean) in zip(boundaries, pool.imap(convert_file_piece, tasks)):
+                if not clean:
+                    break
+                output.write(data)
+                all_errors.extend((position + start, sequence, reason) for position, sequence, reason in errors)
+            else:
+                report_decoding_errors(all_errors, error_stream)
+                return len(all_errors)
+
+        # Malformed input split inside a code, start over with one sequential pass
+        output.seek(0)
+        output.truncate()
+        return convert_stream(iterate_file_chunks(input_path, piece_size), output, mode, error_stream, get_codec(codes))
+
+def warn_phano(stream=sys.stdout):
+    phano_respected, codeA, codeB = respects_phano()
+    if not phano_respected:
+        codes = get_codec().variants
+        print(f"Warning! Phano rule is violated by {get_letter_from_index(codeA)} {'/'.join(codes[codeA])} and {get_letter_from_index(codeB)} {'/'.join(codes[codeB])}", file=stream)
+
+def run_interactive():
+    warn_phano()
+
+    while True:
+        text = input("Text: ")    
+        leet = forward_conversion(text)
+        print(leet)
+
+        leet = input("Leet: ")
+        text = backward_conversion(leet)
+        print(text)
+
+def run_stream(mode, input_path=None, output_path=None, chunk_size=1 << 20, processes=1):
+    warn_phano(sys.stderr)
+
+    from_file = input_path is not None and input_path != '-'
+    to_file = output_path is not None and output_path != '-'
+    if processes != 1 and from_file and to_file:
+        return batch_convert_file(input_path, output_path, mode, processes)
+
+    if input_path is None or input_path == '-':
+        chunks = iterate_stream_chunks(sys.stdin.buffer, chunk_size)
+    else:
+        chunks = iterate_file_chunks(input_path, chunk_size)
+
+    if output_path is None or output_path == '-':
+        return convert_stream(chunks, sys.stdout.buffer, mode)
+
+    with open(output_path, 'wb') as output:
+        return convert_stream(chunks, output, mode)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Leet converter. Runs interactively unless a mode is given")
+    parser.add_argument("mode", nargs="?", choices=["encode", "decode"], help="stream the input through the codec")
+    parser.add_argument("-i", "--input", default=None, help="input file, stdin by default")
+    parser.add_argument("-o", "--output", default=None, help="output file, stdout by default")
+    parser.add_argument("--chunk-size", type=int, default=1 << 20, help="bytes processed at a time")
+    parser.add_argument("-j", "--processes", type=int, default=1, help="worker processes for file to file conversion, 0 for all cores")
+    args = parser.parse_args()
+
+    if args.mode is None:
+        run_interactive()
+    else:
+        error_count = run_stream(args.mode, args.input, args.output, args.chunk_size, args.processes or None)
+        sys.exit(1 if error_count else 0)
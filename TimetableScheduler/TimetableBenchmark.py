@@ -0,0 +1,125 @@
+from TimetableScheduler import Course, DayOfWeek, TimetableEntry
+from TimetableScheduler import get_combination_intersection_time, get_combination_window_time, get_combinations, validate_combination
+import argparse
+import csv
+import random
+import time
+
+WEEKDAYS = [DayOfWeek.MONDAY, DayOfWeek.TUESDAY, DayOfWeek.WEDNESDAY, DayOfWeek.THURSDAY, DayOfWeek.FRIDAY]
+FIRST_HOUR = 8
+LAST_HOUR = 18
+
+def generate_catalog(courseCount, seed=0, slotsPerCourse=(1, 3), groupSize=4, groupRatio=0.2, mandatoryRatio=0.25, conflictDensity=0.3):
+    # Seeded synthetic catalog on a Monday-Friday 8:00-18:00 grid of whole hours.
+    # groupRatio is the share of courses that belong to groups of groupSize courses,
+    # mandatoryRatio the share of those groups that are mandatory, and conflictDensity
+    # the chance that a slot reuses an hour already taken by another course
+    rng = random.Random(seed)
+    taken_hours = []
+    courses = []
+
+    groupedCount = int(courseCount * groupRatio)
+    groupCount = (groupedCount + groupSize - 1) // groupSize if groupSize > 0 else 0
+    mandatoryGroups = set(rng.sample(range(groupCount), int(groupCount * mandatoryRatio)))
+
+    for index in range(courseCount):
+        groupId = None
+        isMandatory = False
+        if index < groupedCount and groupSize > 0:
+            groupId = index // groupSize + 1
+            isMandatory = groupId - 1 in mandatoryGroups
+
+        slots = []
+        for _ in range(rng.randint(slotsPerCourse[0], slotsPerCourse[1])):
+            length = rng.randint(1, 3)
+            if taken_hours and rng.random() < conflictDensity:
+                day, hour = rng.choice(taken_hours)
+                hour = min(hour, LAST_HOUR - length)
+            else:
+                day = rng.choice(WEEKDAYS)
+                hour = rng.randint(FIRST_HOUR, LAST_HOUR - length)
+
+            slot = TimetableEntry(day, hour, 0, hour + length, 0)
+            if any(slot.get_intersection_minutes(other) > 0 for other in slots):
+                continue
+            slots.append(slot)
+            taken_hours.append((day, hour))
+
+        courses.append(Course(f"Course {index}", slots, groupId=groupId, isMandatory=isMandatory))
+
+    # Groups are spread over the catalog instead of sitting at its start
+    rng.shuffle(courses)
+    return courses
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+def sample_combinations(courses, length, samples, seed):
+    rng = random.Random(seed)
+    return [tuple(rng.sample(courses, length)) for _ in range(samples)]
+
+def benchmark_catalog(courses, length, cutoff, samples, repeat, seed, topK=None, processes=1):
+    mandatory_courses = [course for course in courses if course.isMandatory]
+    sample = sample_combinations(courses, length, samples, seed)
+
+    def run_validate():
+        for combination in sample:
+            validate_combination(combination, mandatory_courses)
+
+    def run_intersection():
+        for combination in sample:
+            get_combination_intersection_time(combination)
+
+    def run_window():
+        for combination in sample:
+            get_combination_window_time(combination)
+
+    results = []
+    elapsed, combinations = best_time(lambda: get_combinations(courses, length, cutoff, topK, processes), repeat)
+    results.append(("get_combinations", len(combinations), elapsed))
+    for name, function in (("validate_combination", run_validate),
+                           ("get_combination_intersection_time", run_intersection),
+                           ("get_combination_window_time", run_window)):
+        elapsed, _ = best_time(function, repeat)
+        results.append((name, len(sample), elapsed))
+    return results
+
+def run_benchmarks(sizes, length, cutoff, samples, repeat, seed, topK=None, processes=1, conflictDensity=0.3):
+    rows = []
+    for size in sizes:
+        courses = generate_catalog(size, seed, conflictDensity=conflictDensity)
+        for name, count, elapsed in benchmark_catalog(courses, length, cutoff, samples, repeat, seed, topK, processes):
+            rate = count / elapsed if elapsed > 0 else float("inf")
+            rows.append({"courses": size, "function": name, "combinations": count, "seconds": elapsed, "combinations_per_second": rate})
+            print(f"{size:>5} courses  {name:<36} {count:>10} combinations  {elapsed:10.4f} s  {rate:14.0f} /s")
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the timetable scheduler on synthetic catalogs")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20, 40, 60, 100, 150])
+    parser.add_argument("--length", type=int, default=4, help="courses per schedule")
+    parser.add_argument("--cutoff", type=int, default=60, help="intersection cutoff in minutes")
+    parser.add_argument("--samples", type=int, default=10000, help="random combinations for the per-function timings")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement, the best one is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--top", type=int, default=None, help="use the top-K mode of get_combinations")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--conflict-density", type=float, default=0.3)
+    parser.add_argument("--csv", default=None, help="also write the results to this CSV file")
+    args = parser.parse_args()
+
+    rows = run_benchmarks(args.sizes, args.length, args.cutoff, args.samples, args.repeat, args.seed,
+                          args.top, args.processes, args.conflict_density)
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
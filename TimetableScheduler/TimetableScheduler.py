@@ -1,6 +1,12 @@
 from enum import Enum
-from itertools import combinations
-from functools import cmp_to_key
+from math import gcd
+import argparse
+import csv
+import hashlib
+import heapq
+import json
+import multiprocessing
+import os
 
 class DayOfWeek(Enum):
     MONDAY = 1,
@@ -8,8 +14,10 @@ class DayOfWeek(Enum):
     WEDNESDAY = 3,
     THURSDAY = 4,
     FRIDAY = 5,
-    SATURDAY = 6 
-    SUNDAY = 7
+    SATURDAY = 6,
+    SUNDAY = 7,
+
+MINUTES_PER_DAY = 24 * 60
 
 
 class TimetableEntry:
@@ -29,6 +37,15 @@ class TimetableEntry:
             return diff
         return 0
 
+    def get_occupancy(self, resolution=1):
+        slotsPerDay = MINUTES_PER_DAY // resolution
+        dayOffset = (self.day.value[0] - 1) * slotsPerDay
+        start = dayOffset + self.startMinute // resolution
+        end = dayOffset + self.endMinute // resolution
+        if end <= start:
+            return 0
+        return ((1 << (end - start)) - 1) << start
+
     def __str__(self):
         startHour = int(self.startMinute / 60)
         startMinute = int(self.startMinute % 60)
@@ -39,15 +56,6 @@ class TimetableEntry:
     def __repr__(self) -> str:
         return self.__str__()
 
-    @staticmethod
-    def compare(slot0, slot1):
-        if slot0.day.value[0] < slot1.day.value[0]:
-            return -1
-        elif slot1.day.value[0] < slot0.day.value[0]:
-            return 1
-        else:
-            return slot0.startMinute - slot1.startMinute
-
 
 class Course:
 
@@ -56,6 +64,8 @@ class Course:
         self.timeSlots = timeSlots
         self.groupId = groupId
         self.isMandatory = isMandatory
+        self.occupancy = None
+        self.occupancyResolution = None
 
     def __str__(self):
         result = self.name + ": "
@@ -67,6 +77,21 @@ class Course:
 
         return result
 
+    def get_occupancy(self, resolution=1):
+        # Week occupancy bitmask, one bit per resolution minutes, compiled once per resolution
+        if self.occupancyResolution != resolution:
+            occupancy = 0
+            for slot in self.timeSlots:
+                occupancy |= slot.get_occupancy(resolution)
+            self.occupancy = occupancy
+            self.occupancyResolution = resolution
+        return self.occupancy
+
+    def get_content_hash(self):
+        slots = [(slot.day.name, slot.startMinute, slot.endMinute) for slot in self.timeSlots]
+        content = json.dumps([self.name, slots, repr(self.groupId), self.isMandatory])
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
     def get_intersection_time(self, otherCourse):
         time = 0
         for slot in self.timeSlots:
@@ -74,6 +99,38 @@ class Course:
                 time += slot.get_intersection_minutes(otherSlot)
         return time
 
+def get_time_resolution(courses):
+    resolution = MINUTES_PER_DAY
+    for course in courses:
+        for slot in course.timeSlots:
+            resolution = gcd(resolution, slot.startMinute, slot.endMinute)
+    return resolution
+
+def get_occupancy_windows(occupancy, resolution=1):
+    slotsPerDay = MINUTES_PER_DAY // resolution
+    dayMask = (1 << slotsPerDay) - 1
+
+    windowsSum = 0
+    windows = []
+    for day in DayOfWeek:
+        dayOccupancy = (occupancy >> ((day.value[0] - 1) * slotsPerDay)) & dayMask
+        if not dayOccupancy:
+            continue
+
+        first = (dayOccupancy & -dayOccupancy).bit_length() - 1
+        last = dayOccupancy.bit_length()
+        gaps = ~dayOccupancy & ((1 << last) - (1 << first))
+        windowsSum += gaps.bit_count() * resolution
+
+        while gaps:
+            gapStart = (gaps & -gaps).bit_length() - 1
+            shifted = gaps >> gapStart
+            gapLength = (~shifted & (shifted + 1)).bit_length() - 1
+            windows.append((day, gapStart * resolution, (gapStart + gapLength) * resolution))
+            gaps &= ~(((1 << gapLength) - 1) << gapStart)
+
+    return windowsSum, windows
+
 def get_combination_intersection_time(combination):
     intersecting_courses = []
     time = 0
@@ -85,55 +142,58 @@ def get_combination_intersection_time(combination):
                 intersecting_courses.append((combination[i], combination[j]))
     return time, intersecting_courses
 
-def get_day_windows(dayTimetable):
-
-    windows = [] 
-    time_sum = 0
-
-    dayTimetable.sort(key = cmp_to_key(TimetableEntry.compare))
-
-    prev_end = None
-    for slot in dayTimetable:
-        if prev_end is None:
-            prev_end = slot.endMinute
-            continue
-
-        diff = slot.startMinute - prev_end
-        if diff > 0:
-            windows.append((slot.day, prev_end, slot.startMinute))
-            time_sum += diff
-
-        prev_end = slot.endMinute
-
-    return time_sum, windows
-
-def get_combination_window_time(combination):
-
-    windowsSum = 0
-
-    dayTimetables = {}
-    windows = []
-
+class ConflictMatrix:
+
+    def __init__(self, courses, pairCache=None):
+        self.courses = courses
+        self.resolution = get_time_resolution(courses)
+        self.occupancies = [course.get_occupancy(self.resolution) for course in courses]
+        count = len(courses)
+        self.intersections = [[0] * count for _ in range(count)]
+        self.conflicting_pairs = []
+
+        # pairCache maps a pair of course content hashes to their intersection minutes
+        hashes = None
+        if pairCache is not None:
+            hashes = [course.get_content_hash() for course in courses]
+
+        for i in range(count):
+            for j in range(i + 1, count):
+                if hashes is None:
+                    intersection = (self.occupancies[i] & self.occupancies[j]).bit_count() * self.resolution
+                else:
+                    pairKey = ":".join(sorted((hashes[i], hashes[j])))
+                    intersection = pairCache.get(pairKey)
+                    if intersection is None:
+                        intersection = (self.occupancies[i] & self.occupancies[j]).bit_count() * self.resolution
+                        pairCache[pairKey] = intersection
+                if intersection <= 0:
+                    continue
+                self.intersections[i][j] = intersection
+                self.intersections[j][i] = intersection
+                self.conflicting_pairs.append((i, j))
+
+    def get_combination_intersection_time(self, indices):
+        intersecting_courses = []
+        time = 0
+        for i in range(len(indices)):
+            row = self.intersections[indices[i]]
+            for j in range(i + 1, len(indices)):
+                intersection = row[indices[j]]
+                if intersection > 0:
+                    time += intersection
+                    intersecting_courses.append((self.courses[indices[i]], self.courses[indices[j]]))
+        return time, intersecting_courses
+
+def get_combination_window_time(combination, resolution=None):
+    if resolution is None:
+        resolution = get_time_resolution(combination)
+
+    occupancy = 0
     for course in combination:
-        for slot in course.timeSlots:
-           
-            arr = []
-            if slot.day.value[0] not in dayTimetables:                
-                dayTimetables[slot.day.value[0]] = arr    
-            else:
-                arr = dayTimetables[slot.day.value[0]]
-
-            arr.append(slot)
-
-    for dayIndex in range(1, 8):
-        if dayIndex not in dayTimetables:
-            continue
-        dayTimetable, dayWindows = get_day_windows(dayTimetables[dayIndex])
-        windowsSum += dayTimetable
-        for window in dayWindows:
-            windows.append(window)
+        occupancy |= course.get_occupancy(resolution)
 
-    return windowsSum, windows
+    return get_occupancy_windows(occupancy, resolution)
 
 def print_combination(combination):
     for course in combination:
@@ -155,19 +215,6 @@ def validate_combination(combination, mandatoryCourses):
 
     return True                
 
-def combination_comparator(tuple0, tuple1):
-    intersectionTime0 = tuple0[1]
-    intersectionTime1 = tuple1[1]
-    windowTime0 = tuple0[2]
-    windowTime1 = tuple1[2]
-
-    if intersectionTime0 < intersectionTime1:
-        return -1
-    elif intersectionTime0 > intersectionTime1:
-        return 1
-    else: 
-        return windowTime0 - windowTime1
-
 def course_tuple_to_string(course_tuple):
     text = ""
     for course_index in range(len(course_tuple)):
@@ -177,29 +224,505 @@ def course_tuple_to_string(course_tuple):
 
     return text
 
-def get_combinations(courses, maxLength, cutoffIntersectionTime=10000):
-    mandatory_courses = []
-    for course in courses:
-        if course.isMandatory:
-            mandatory_courses.append(course)
+class CombinationSearch:
+
+    def __init__(self, courses, maxLength, cutoffIntersectionTime=10000, minLength=None, pairCache=None, requiredIndices=None):
+        self.courses = courses
+        self.maxLength = maxLength
+        self.minLength = maxLength if minLength is None else minLength
+        self.cutoffIntersectionTime = cutoffIntersectionTime
+        self.conflict_matrix = ConflictMatrix(courses, pairCache)
+        self.reset_cutoffs()
+
+        # When set, only schedules with at least one of these courses are produced
+        self.requiredIndices = None if requiredIndices is None else set(requiredIndices)
+        self.last_required = max(self.requiredIndices, default=-1) if requiredIndices is not None else None
+
+        # A mandatory course is covered by itself or by any course of its group
+        self.requirements = []
+        for index, course in enumerate(courses):
+            if not course.isMandatory:
+                continue
+            requirement = ("course", index) if course.groupId is None else ("group", course.groupId)
+            if requirement not in self.requirements:
+                self.requirements.append(requirement)
+
+        self.course_requirements = []
+        self.last_candidates = {}
+        for index, course in enumerate(courses):
+            requirement = ("course", index) if course.groupId is None else ("group", course.groupId)
+            if requirement not in self.requirements:
+                requirement = None
+            else:
+                self.last_candidates[requirement] = index
+            self.course_requirements.append(requirement)
+
+    def reset_cutoffs(self):
+        self.lengthCutoffs = [self.cutoffIntersectionTime] * (self.maxLength + 1)
+        self.reachCutoffs = list(self.lengthCutoffs)
+
+    def set_length_cutoff(self, length, cutoffIntersectionTime):
+        self.lengthCutoffs[length] = cutoffIntersectionTime
+
+        # A prefix of length k is still worth extending while any length >= k accepts it
+        reach = -1
+        for index in range(self.maxLength, -1, -1):
+            if index >= self.minLength:
+                reach = max(reach, self.lengthCutoffs[index])
+            self.reachCutoffs[index] = reach
+
+    def iterate(self, firstIndex=None):
+        state = ScheduleState(self)
+        if firstIndex is None:
+            yield from self._extend(state, 0)
+        else:
+            yield from self._extend(state, firstIndex, firstIndex + 1)
+
+    def _extend(self, state, start, stop=None):
+        length = len(state.indices)
+        unsatisfied = state.unsatisfied
+        lacks_required = self.requiredIndices is not None and state.required_count == 0
+        if length >= self.minLength and not unsatisfied and not lacks_required:
+            yield state
+
+        # Every schedule of this size range passes through its shorter prefixes,
+        # so scores of size-k schedules seed the evaluation of size k+1
+        remaining = self.maxLength - length
+        if remaining == 0 or len(unsatisfied) > remaining:
+            return
+
+        deadline = min((self.last_candidates[requirement] for requirement in unsatisfied), default=len(self.courses))
+        if lacks_required:
+            deadline = min(deadline, self.last_required)
+
+        cutoff = self.reachCutoffs[length + 1]
+        last = len(self.courses) - max(self.minLength - length, 1)
+        stop = last + 1 if stop is None else min(stop, last + 1)
+
+        for index in range(start, stop):
+            # Past the last course able to cover a requirement, no branch can become valid
+            if index > deadline:
+                break
+
+            course = self.courses[index]
+            if course.groupId is not None and course.groupId in state.present_groups:
+                continue
+
+            extended_time = state.get_extended_intersection_time(index)
+            if extended_time > cutoff:
+                continue
+
+            requirement = self.course_requirements[index]
+            covers = requirement is not None and requirement in unsatisfied
+
+            feasible = len(unsatisfied) - covers <= remaining - 1
+            if feasible:
+                for other in unsatisfied:
+                    if other != requirement and self.last_candidates[other] <= index:
+                        feasible = False
+                        break
+            if not feasible:
+                continue
+
+            state.extend(index, extended_time)
+            yield from self._extend(state, index + 1)
+            state.rollback()
+
+class ScheduleState:
+
+    # Scores of the schedule prefix currently explored by the search. Extending by one
+    # course costs O(k) and rollback restores the previous prefix, so combinations
+    # sharing a prefix never recompute it
+
+    def __init__(self, search):
+        self.search = search
+        self.indices = []
+        self.intersection_times = [0]
+        self.occupancies = [0]
+        self.intersecting_pairs = []
+        self.pair_counts = [0]
+        self.present_groups = set()
+        self.unsatisfied = set(search.requirements)
+        self.covered_requirements = []
+        self.required_count = 0
+
+    @property
+    def intersection_time(self):
+        return self.intersection_times[-1]
+
+    @property
+    def occupancy(self):
+        return self.occupancies[-1]
+
+    def get_extended_intersection_time(self, index):
+        row = self.search.conflict_matrix.intersections[index]
+        time = self.intersection_times[-1]
+        for chosen_index in self.indices:
+            time += row[chosen_index]
+        return time
 
-    combs = combinations(courses, maxLength)
+    def extend(self, index, intersection_time):
+        conflict_matrix = self.search.conflict_matrix
+        row = conflict_matrix.intersections[index]
+        for chosen_index in self.indices:
+            if row[chosen_index] > 0:
+                self.intersecting_pairs.append((chosen_index, index))
+        self.pair_counts.append(len(self.intersecting_pairs))
+
+        self.indices.append(index)
+        self.intersection_times.append(intersection_time)
+        self.occupancies.append(self.occupancies[-1] | conflict_matrix.occupancies[index])
+
+        groupId = self.search.courses[index].groupId
+        if groupId is not None:
+            self.present_groups.add(groupId)
+
+        requirement = self.search.course_requirements[index]
+        if requirement is not None and requirement in self.unsatisfied:
+            self.unsatisfied.remove(requirement)
+        else:
+            requirement = None
+        self.covered_requirements.append(requirement)
+
+        if self.search.requiredIndices is not None and index in self.search.requiredIndices:
+            self.required_count += 1
+
+    def rollback(self):
+        index = self.indices.pop()
+        if self.search.requiredIndices is not None and index in self.search.requiredIndices:
+            self.required_count -= 1
+        self.intersection_times.pop()
+        self.occupancies.pop()
+        self.pair_counts.pop()
+        del self.intersecting_pairs[self.pair_counts[-1]:]
+
+        groupId = self.search.courses[index].groupId
+        if groupId is not None:
+            self.present_groups.discard(groupId)
+
+        requirement = self.covered_requirements.pop()
+        if requirement is not None:
+            self.unsatisfied.add(requirement)
+
+def combination_key(combination_info):
+    return combination_info[1], combination_info[2]
+
+def get_combination_info(search, state):
+    courses = search.courses
+    combination = tuple(courses[index] for index in state.indices)
+    intersecting_courses = [(courses[i], courses[j]) for i, j in sorted(state.intersecting_pairs)]
+
+    window_time, window_list = get_occupancy_windows(state.occupancy, search.conflict_matrix.resolution)
+    return combination, state.intersection_time, window_time, intersecting_courses, window_list
+
+def iterate_combinations(courses, maxLength, cutoffIntersectionTime=10000, minLength=None):
+    search = CombinationSearch(courses, maxLength, cutoffIntersectionTime, minLength)
+    for state in search.iterate():
+        yield get_combination_info(search, state)
+
+def select_top_combinations(search, topK, firstIndex=None):
+    lengths = range(search.minLength, search.maxLength + 1)
+    if topK <= 0:
+        return {length: [] for length in lengths}
+
+    # Per length, a max-heap of the best topK schedules with the worst one on top.
+    # The sequence number keeps ties in enumeration order, exactly as the stable sort does
+    heaps = {length: [] for length in lengths}
+    for sequence, state in enumerate(search.iterate(firstIndex)):
+        length = len(state.indices)
+        heap = heaps[length]
+        combination_info = get_combination_info(search, state)
+        entry = (-combination_info[1], -combination_info[2], -sequence, tuple(state.indices), combination_info)
+        if len(heap) < topK:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+        else:
+            continue
+
+        # Once a heap is full, schedules worse than its worst intersection can't get in
+        if len(heap) == topK:
+            search.set_length_cutoff(length, min(search.cutoffIntersectionTime, -heap[0][0]))
+
+    search.reset_cutoffs()
+
+    selected = {}
+    for length, heap in heaps.items():
+        heap.sort(reverse=True)
+        selected[length] = [(entry[3], entry[4]) for entry in heap]
+    return selected
+
+def get_top_combinations(courses, maxLength, topK, cutoffIntersectionTime=10000):
+    search = CombinationSearch(courses, maxLength, cutoffIntersectionTime)
+    return [combination_info for _, combination_info in select_top_combinations(search, topK)[maxLength]]
+
+_worker_search = None
+_worker_top_k = None
+
+def _init_shard_worker(courses, maxLength, cutoffIntersectionTime, topK, minLength=None):
+    global _worker_search, _worker_top_k
+    _worker_search = CombinationSearch(courses, maxLength, cutoffIntersectionTime, minLength)
+    _worker_top_k = topK
+
+def _score_shard(firstIndex):
+    if _worker_top_k is None:
+        shards = {length: [] for length in range(_worker_search.minLength, _worker_search.maxLength + 1)}
+        for state in _worker_search.iterate(firstIndex):
+            shards[len(state.indices)].append((tuple(state.indices), get_combination_info(_worker_search, state)))
+        for shard in shards.values():
+            shard.sort(key = lambda item: combination_key(item[1]))
+    else:
+        shards = select_top_combinations(_worker_search, _worker_top_k, firstIndex)
+
+    # Courses are sent back as indices, the parent maps them onto its own objects
+    results = {}
+    for length, shard in shards.items():
+        results[length] = [(indices, info[1], info[2], info[4]) for indices, info in shard]
+    return results
+
+def _get_combinations_parallel(courses, minLength, maxLength, cutoffIntersectionTime, topK, processes):
+    search = CombinationSearch(courses, maxLength, cutoffIntersectionTime, minLength)
+
+    # One shard per first course. Shards come back in index order, so a stable sort
+    # of their concatenation reproduces the serial ordering of ties
+    results = {length: [] for length in range(search.minLength, maxLength + 1)}
+    initargs = (courses, maxLength, cutoffIntersectionTime, topK, minLength)
+    with multiprocessing.Pool(processes, initializer=_init_shard_worker, initargs=initargs) as pool:
+        for shards in pool.imap(_score_shard, range(len(courses))):
+            for length, shard in shards.items():
+                results[length].extend(shard)
+
+    combinations_by_length = {}
+    for length, length_results in results.items():
+        length_results.sort(key = lambda result: (result[1], result[2]))
+        if topK is not None:
+            length_results = length_results[:max(topK, 0)]
+
+        combination_list = []
+        for indices, intersection_time, window_time, window_list in length_results:
+            combination = tuple(courses[index] for index in indices)
+            _, intersecting_courses = search.conflict_matrix.get_combination_intersection_time(indices)
+            combination_list.append((combination, intersection_time, window_time, intersecting_courses, window_list))
+        combinations_by_length[length] = combination_list
+    return combinations_by_length
+
+def get_combinations_parallel(courses, maxLength, cutoffIntersectionTime=10000, topK=None, processes=None):
+    return _get_combinations_parallel(courses, maxLength, maxLength, cutoffIntersectionTime, topK, processes)[maxLength]
+
+def get_combinations_range(courses, minLength, maxLength, cutoffIntersectionTime=10000, topK=None, processes=1):
+    # One search over all sizes, returns {length: sorted combination list}
+    if processes != 1:
+        return _get_combinations_parallel(courses, minLength, maxLength, cutoffIntersectionTime, topK, processes)
+
+    search = CombinationSearch(courses, maxLength, cutoffIntersectionTime, minLength)
+    if topK is not None:
+        selected = select_top_combinations(search, topK)
+        return {length: [info for _, info in infos] for length, infos in selected.items()}
+
+    combinations_by_length = {length: [] for length in range(minLength, maxLength + 1)}
+    for state in search.iterate():
+        combinations_by_length[len(state.indices)].append(get_combination_info(search, state))
+    for combination_list in combinations_by_length.values():
+        combination_list.sort(key = combination_key)
+    return combinations_by_length
+
+class ScheduleCache:
+
+    # On-disk store of pair intersections and of the valid schedules of previous runs,
+    # everything keyed by course content hashes so it survives catalog edits.
+    # Without a path it only lives for one call
+
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.pairs = {}
+        self.solutions = {}
+        if path and os.path.exists(path):
+            with open(path, "r") as f:
+                data = json.load(f)
+            if data.get("version") == ScheduleCache.VERSION:
+                self.pairs = data["pairs"]
+                self.solutions = data["solutions"]
+
+    def save(self):
+        if not self.path:
+            return
+        data = {"version": ScheduleCache.VERSION, "pairs": self.pairs, "solutions": self.solutions}
+        temporaryPath = self.path + ".tmp"
+        with open(temporaryPath, "w") as f:
+            f.write(json.dumps(data))
+        os.replace(temporaryPath, self.path)
+
+def get_requirement_signature(courses, hashes):
+    signature = set()
+    for course, courseHash in zip(courses, hashes):
+        if course.isMandatory:
+            signature.add(("course", courseHash) if course.groupId is None else ("group", repr(course.groupId)))
+    return sorted(signature)
+
+def get_combinations_cached(courses, maxLength, cutoffIntersectionTime=10000, cachePath="ScheduleCache.json", topK=None):
+    cache = ScheduleCache(cachePath)
+    hashes = [course.get_content_hash() for course in courses]
+    signature = [list(requirement) for requirement in get_requirement_signature(courses, hashes)]
+    solutionKey = f"{maxLength}:{cutoffIntersectionTime}"
+    previous = cache.solutions.get(solutionKey)
+
+    # Schedules built only from unchanged courses keep their validity and scores as long
+    # as the mandatory requirements are the same, so only the rest is searched again
+    hashIndices = {courseHash: index for index, courseHash in enumerate(hashes)}
+    reusable = len(hashIndices) == len(hashes) and previous is not None and previous["requirements"] == signature
+
+    results = []
+    requiredIndices = None
+    if reusable:
+        previousHashes = set(previous["courses"])
+        requiredIndices = [index for index, courseHash in enumerate(hashes) if courseHash not in previousHashes]
+        for resultHashes, intersection_time, window_time in previous["results"]:
+            if all(courseHash in hashIndices for courseHash in resultHashes):
+                indices = tuple(sorted(hashIndices[courseHash] for courseHash in resultHashes))
+                results.append((intersection_time, window_time, indices, None))
+
+    pairCount = len(cache.pairs)
+    search = CombinationSearch(courses, maxLength, cutoffIntersectionTime, pairCache=cache.pairs, requiredIndices=requiredIndices)
+    for state in search.iterate():
+        combination_info = get_combination_info(search, state)
+        results.append((combination_info[1], combination_info[2], tuple(state.indices), combination_info))
+
+    # Same order as a fresh solve: the stable sort of lexicographic enumeration
+    results.sort(key = lambda result: result[:3])
+
+    unchanged = reusable and not requiredIndices and previous["courses"] == hashes
+    if len(hashIndices) == len(hashes) and not unchanged:
+        cache.solutions[solutionKey] = {
+            "courses": hashes,
+            "requirements": signature,
+            "results": [[[hashes[index] for index in result[2]], result[0], result[1]] for result in results],
+        }
+    if not unchanged or len(cache.pairs) != pairCount:
+        cache.save()
+
+    if topK is not None:
+        results = results[:max(topK, 0)]
 
     combination_list = []
+    for intersection_time, window_time, indices, combination_info in results:
+        if combination_info is None:
+            combination = tuple(courses[index] for index in indices)
+            _, intersecting_courses = search.conflict_matrix.get_combination_intersection_time(indices)
+            _, window_list = get_combination_window_time(combination, search.conflict_matrix.resolution)
+            combination_info = (combination, intersection_time, window_time, intersecting_courses, window_list)
+        combination_list.append(combination_info)
+    return combination_list
 
-    for combination in combs:
-        if not validate_combination(combination, mandatory_courses):
-            continue
+def format_minutes(minutes):
+    return f"{int(minutes / 60)}:{int(minutes % 60)}"
 
-        intersection_time, intersecting_courses = get_combination_intersection_time(combination)
-        if intersection_time > cutoffIntersectionTime:
-            continue
+def format_window(window_tuple):
+    return f"{window_tuple[0].name} {format_minutes(window_tuple[1])} - {format_minutes(window_tuple[2])}"
 
-        window_time, window_list = get_combination_window_time(combination)
-        combination_info = (combination, intersection_time, window_time, intersecting_courses, window_list)
-        combination_list.append(combination_info)
+REPORT_EXTENSIONS = {"text": ".txt", "jsonl": ".jsonl", "csv": ".csv"}
+
+class ReportWriter:
 
-    combination_list.sort(key = cmp_to_key(combination_comparator))
+    # Writes combination_info tuples as they arrive. Records are formatted into a
+    # buffer and flushed in batches, course descriptions are formatted once per course
+
+    def __init__(self, f, reportFormat="text", batchSize=1000):
+        if reportFormat not in REPORT_EXTENSIONS:
+            raise ValueError(f"Unknown report format: {reportFormat}")
+
+        self.f = f
+        self.reportFormat = reportFormat
+        self.batchSize = batchSize
+        self.buffer = []
+        self.course_strings = {}
+        self.csv_writer = None
+
+        if reportFormat == "csv":
+            self.csv_writer = csv.writer(f)
+            self.csv_writer.writerow(["courses", "intersection_time", "window_time", "intersections", "windows"])
+
+    def get_course_string(self, course):
+        text = self.course_strings.get(id(course))
+        if text is None:
+            text = str(course)
+            self.course_strings[id(course)] = text
+        return text
+
+    def format_text(self, combination_info):
+        lines = [self.get_course_string(course) + "\n" for course in combination_info[0]]
+
+        lines.append(f"\tIntersection Time: {combination_info[1]} minutes\n")
+        if combination_info[3]:
+            intersections = "".join(f"[{course_tuple_to_string(course_tuple)}] " for course_tuple in combination_info[3])
+            lines.append(f"\tIntersections: {intersections}\n")
+
+        lines.append(f"\tWindow Time: {combination_info[2]} minutes\n")
+        if combination_info[4]:
+            windows = "".join(f"[{format_window(window_tuple)}] " for window_tuple in combination_info[4])
+            lines.append(f"\tWindows: {windows}\n")
+
+        lines.append("\n")
+        return "".join(lines)
+
+    def format_json(self, combination_info):
+        record = {
+            "courses": [course.name for course in combination_info[0]],
+            "intersection_time": combination_info[1],
+            "window_time": combination_info[2],
+            "intersections": [[course.name for course in course_tuple] for course_tuple in combination_info[3]],
+            "windows": [{"day": day.name, "start": start, "end": end} for day, start, end in combination_info[4]],
+        }
+        return json.dumps(record) + "\n"
+
+    def format_row(self, combination_info):
+        return [
+            "; ".join(course.name for course in combination_info[0]),
+            combination_info[1],
+            combination_info[2],
+            "; ".join(course_tuple_to_string(course_tuple) for course_tuple in combination_info[3]),
+            "; ".join(format_window(window_tuple) for window_tuple in combination_info[4]),
+        ]
+
+    def write(self, combination_info):
+        if self.reportFormat == "text":
+            self.buffer.append(self.format_text(combination_info))
+        elif self.reportFormat == "jsonl":
+            self.buffer.append(self.format_json(combination_info))
+        else:
+            self.buffer.append(self.format_row(combination_info))
+
+        if len(self.buffer) >= self.batchSize:
+            self.flush()
+
+    def flush(self):
+        if self.csv_writer is not None:
+            self.csv_writer.writerows(self.buffer)
+        else:
+            self.f.writelines(self.buffer)
+        self.buffer.clear()
+
+def write_report(combination_infos, path, reportFormat="text", batchSize=1000):
+    # combination_infos may be any iterable, e.g. iterate_combinations for unsorted streaming
+    count = 0
+    with open(path, "w", newline="" if reportFormat == "csv" else None) as f:
+        writer = ReportWriter(f, reportFormat, batchSize)
+        for combination_info in combination_infos:
+            writer.write(combination_info)
+            count += 1
+        writer.flush()
+    return count
+
+def get_combinations(courses, maxLength, cutoffIntersectionTime=10000, topK=None, processes=1):
+    if processes != 1:
+        return get_combinations_parallel(courses, maxLength, cutoffIntersectionTime, topK, processes)
+
+    if topK is not None:
+        return get_top_combinations(courses, maxLength, topK, cutoffIntersectionTime)
+
+    combination_list = list(iterate_combinations(courses, maxLength, cutoffIntersectionTime))
+    combination_list.sort(key = combination_key)
     return combination_list
 
 courses = [
@@ -294,42 +817,18 @@ courses = [
     ], groupId=1, isMandatory=True),
 ]
 
-print(f"Courses number: {len(courses)}")
-
-combination_infos = get_combinations(courses, 6, 60)
-
-print(f"Filtered combinations number: {len(combination_infos)}")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Finds course combinations with the fewest intersections and windows")
+    parser.add_argument("--output", default="Output", help="report path without extension")
+    parser.add_argument("--cache", default="ScheduleCache.json", help="cache of previous solves, empty to disable")
+    parser.add_argument("--format", action="append", choices=REPORT_EXTENSIONS.keys(), help="report format, may be repeated (default: text)")
+    args = parser.parse_args()
 
-number_to_print = len(combination_infos)
-
-with open("Output.txt", "w") as f:
-    for i in range(len(combination_infos)):
-        combination_info = combination_infos[i]
-        for course in combination_info[0]:
-            f.write(str(course))
-            f.write("\n")
-
-        f.write(f"\tIntersection Time: {combination_info[1]} minutes\n")        
-        if combination_info[3]:
-            f.write(f"\tIntersections: ")
-            for course_tuple in combination_info[3]:
-                f.write(f"[{course_tuple_to_string(course_tuple)}] ")
-            f.write("\n")
-       
-        f.write(f"\tWindow Time: {combination_info[2]} minutes\n")
-        if combination_info[4]:
-            f.write(f"\tWindows: ")
-            for window_tuple in combination_info[4]:
-                hour1 = int(window_tuple[1] / 60)
-                minute1 = int(window_tuple[1] % 60)
-                hour2 = int(window_tuple[2] / 60)
-                minute2 = int(window_tuple[2] % 60)
-                f.write(f"[{window_tuple[0].name} {hour1}:{minute1} - {hour2}:{minute2}] ")
-            f.write("\n")
+    print(f"Courses number: {len(courses)}")
 
-        f.write("\n")
+    combination_infos = get_combinations_cached(courses, 6, 60, args.cache or None)
 
-        number_to_print -= 1
-        if number_to_print <= 0:
-            break
+    print(f"Filtered combinations number: {len(combination_infos)}")
 
+    for reportFormat in args.format or ["text"]:
+        write_report(combination_infos, args.output + REPORT_EXTENSIONS[reportFormat], reportFormat)
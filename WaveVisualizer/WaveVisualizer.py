@@ -1,5 +1,7 @@
 from PIL import Image, ImageDraw
+import argparse
 import math
+import numpy as np
 
 FIELD_WIDTH = 100
 FIELD_HEIGHT = 300
@@ -41,6 +43,18 @@ class WaveSource:
     def wave(self, time: float):
         return self.amplitude * math.sin(2 * math.pi * self.frequency * time + self.phase_shift)
 
+    def distance_grid(self, x_values, y_values):
+        # Distances to every (x, y, 0) point of a grid. x_values is a row and y_values a column,
+        # so broadcasting gives one distance per pixel in image (row, column) order
+        dx = self.location.x - x_values
+        dy = self.location.y - y_values
+        dz = self.location.z
+        return np.sqrt(dx * dx + dy * dy + dz * dz)
+
+    def wave_grid(self, time):
+        # Same as wave() for a whole array of times
+        return self.amplitude * np.sin(2 * math.pi * self.frequency * time + self.phase_shift)
+
 
 class SimulationField:
     def __init__(self, wave_source_list, width, height, precision):
@@ -63,6 +77,25 @@ class SimulationField:
             value += src_value
         return value
 
+    def get_grid(self):
+        pixel_width = int(self.width / self.precision)
+        pixel_height = int(self.height / self.precision)
+        x_values = np.arange(pixel_width) * self.precision
+        y_values = (np.arange(pixel_height) * self.precision)[:, np.newaxis]
+        return x_values, y_values
+
+    def snapshot_grid(self, time):
+        # snapshot_location for every pixel at once, one source at a time so memory stays at a few full-size arrays
+        x_values, y_values = self.get_grid()
+        values = np.zeros((len(y_values), len(x_values)))
+        for src in self.wave_sources:
+            time_to_point = src.distance_grid(x_values, y_values) / WAVE_SPEED
+            src_values = src.wave_grid(time + time_to_point)
+            # The wave has not reached points further than it travelled since time 0
+            src_values[time - time_to_point < 0] = 0.0
+            values += src_values
+        return values
+
 
     @staticmethod
     def sine_to_greyscale(value, max_absolute_amplitude=1.0):
@@ -87,7 +120,21 @@ class SimulationField:
         return int(k * value)
 
 
-    def draw_snapshot(self, time):
+    @staticmethod
+    def amplitude_to_greyscale_grid(values, max_absolute_amplitude=1.0):
+        # Same as amplitude_to_greyscale for a whole array, truncating like int() does for non-negative values
+        values = np.minimum(np.abs(values), max_absolute_amplitude)
+        k = 255 / max_absolute_amplitude
+        return (k * values).astype(np.uint8)
+
+
+    def render_snapshot(self, time, max_absolute_amplitude=10.0):
+        values = self.snapshot_grid(time)
+        colors = SimulationField.amplitude_to_greyscale_grid(values, max_absolute_amplitude)
+        return Image.fromarray(colors)
+
+    def render_snapshot_pixels(self, time):
+        # Reference implementation, one pixel at a time
         pixel_width = int(self.width / self.precision)
         pixel_height = int(self.height / self.precision)
 
@@ -104,24 +151,117 @@ class SimulationField:
                 image.putpixel((x, y), color)
             print(f"Row {x} finished")
 
+        return image
+
+    def draw_snapshot(self, time):
+        image = self.render_snapshot(time)
         image.show()
 
-wave_sources = []
-center_x = FIELD_WIDTH / 2
-spacing = 2
-count = 8
-phase_shift = math.radians(-20)
-
-initial_phase = 0.0
-for i in range(count):
-    x = center_x + spacing * (i - count / 2)
-    src = WaveSource(Vector3(x, 50, 0), 1.0, 100.0, initial_phase + i * phase_shift)
-    print(f"Created source on poisiton {str(src.location)}")
-    wave_sources.append(src)
-
-simulator = SimulationField(wave_sources, FIELD_WIDTH, FIELD_HEIGHT, PIXEL_SCALE)
-time = 10.0
-
-simulator.draw_snapshot(time)
-        
-         
\ No newline at end of file
+    def prepare_animation(self, start_time=0.0):
+        return FieldAnimation(self, start_time)
+
+    def render_frames(self, times, max_absolute_amplitude=10.0):
+        # Generator of frames, so long animations never hold more than one frame at a time
+        times = list(times)
+        animation = self.prepare_animation(min(times))
+        for time in times:
+            colors = SimulationField.amplitude_to_greyscale_grid(animation.snapshot_grid(time), max_absolute_amplitude)
+            yield Image.fromarray(colors)
+
+    def save_animation(self, path, times, max_absolute_amplitude=10.0, frame_duration=40):
+        # A .gif path gets one animated GIF with frame_duration milliseconds per frame.
+        # Any other path is a pattern for numbered PNGs such as "frames/frame_{:04d}.png".
+        # Pillow keeps all GIF frames in memory to optimize them, numbered PNGs are written one by one
+        frames = self.render_frames(times, max_absolute_amplitude)
+        if path.lower().endswith(".gif"):
+            first = next(frames)
+            first.save(path, save_all=True, append_images=frames, duration=frame_duration, loop=0)
+            return
+
+        for index, frame in enumerate(frames):
+            frame.save(path.format(index))
+
+
+class FieldAnimation:
+    # Time-independent part of a SimulationField, computed once for all frames.
+    # With psi = 2 * pi * frequency * time_to_point + phase_shift every source adds
+    #     amplitude * sin(2 * pi * frequency * time + psi)
+    #   = sin(2 * pi * frequency * time) * amplitude * cos(psi) + cos(2 * pi * frequency * time) * amplitude * sin(psi)
+    # so the sources that share a frequency sum into two fixed phasor fields, and a frame costs
+    # two multiplications per frequency instead of a distance and a sine per source
+    def __init__(self, field, start_time=0.0):
+        x_values, y_values = field.get_grid()
+        self.shape = (len(y_values), len(x_values))
+        # frequency -> (sum of amplitude * cos(psi), sum of amplitude * sin(psi))
+        self.phasors = {}
+        # (source, pixel indices, time_to_point) of the pixels a source has not reached at start_time,
+        # sorted by time_to_point so the pixels still unreached at a later time are a suffix
+        self.delays = []
+
+        for src in field.wave_sources:
+            time_to_point = src.distance_grid(x_values, y_values) / WAVE_SPEED
+            psi = 2 * math.pi * src.frequency * time_to_point + src.phase_shift
+            cos_field = src.amplitude * np.cos(psi)
+            sin_field = src.amplitude * np.sin(psi)
+            if src.frequency in self.phasors:
+                cos_sum, sin_sum = self.phasors[src.frequency]
+                cos_sum += cos_field
+                sin_sum += sin_field
+            else:
+                self.phasors[src.frequency] = (cos_field, sin_field)
+
+            indices = np.flatnonzero(start_time - time_to_point < 0)
+            if len(indices) > 0:
+                delays = time_to_point.ravel()[indices]
+                order = np.argsort(delays, kind='stable')
+                self.delays.append((src, indices[order], delays[order]))
+
+    def snapshot_grid(self, time):
+        values = np.zeros(self.shape)
+        for frequency, (cos_field, sin_field) in self.phasors.items():
+            angle = 2 * math.pi * frequency * time
+            values += math.sin(angle) * cos_field
+            values += math.cos(angle) * sin_field
+
+        # The wave has not reached points further than it travelled since time 0,
+        # so their part of the phasor sum is taken back out. time - time_to_point < 0
+        # holds exactly for the delays after the last one equal to or below time
+        flat_values = values.reshape(-1)
+        for src, indices, delays in self.delays:
+            first = np.searchsorted(delays, time, side='right')
+            flat_values[indices[first:]] -= src.wave_grid(time + delays[first:])
+        return values
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Draws the field of a row of wave sources")
+    parser.add_argument("--time", type=float, default=10.0, help="time of the snapshot, or of the first frame")
+    parser.add_argument("--output", default=None, help="save the snapshot to this image file instead of showing it")
+    parser.add_argument("--frames", type=int, default=0, help="render an animation of this many frames")
+    parser.add_argument("--frame-time", type=float, default=0.0005, help="simulated seconds between frames")
+    parser.add_argument("--frame-duration", type=int, default=40, help="milliseconds per GIF frame")
+    parser.add_argument("--animation", default="animation.gif", help="animated .gif or a numbered PNG pattern like frame_{:04d}.png")
+    args = parser.parse_args()
+
+    wave_sources = []
+    center_x = FIELD_WIDTH / 2
+    spacing = 2
+    count = 8
+    phase_shift = math.radians(-20)
+
+    initial_phase = 0.0
+    for i in range(count):
+        x = center_x + spacing * (i - count / 2)
+        src = WaveSource(Vector3(x, 50, 0), 1.0, 100.0, initial_phase + i * phase_shift)
+        print(f"Created source on poisiton {str(src.location)}")
+        wave_sources.append(src)
+
+    simulator = SimulationField(wave_sources, FIELD_WIDTH, FIELD_HEIGHT, PIXEL_SCALE)
+    time = args.time
+
+    if args.frames > 0:
+        times = [time + i * args.frame_time for i in range(args.frames)]
+        simulator.save_animation(args.animation, times, frame_duration=args.frame_duration)
+    elif args.output:
+        simulator.render_snapshot(time).save(args.output)
+    else:
+        simulator.draw_snapshot(time)